@@ -1,3 +1,4 @@
+import os
 import getpass
 import logging
 import sys
@@ -5,6 +6,9 @@ from .sync import Sync
 from .repo import Repository
 from .status import StatusReporter
 from .versions import Versions
+from .journal import Journal, NothingJournal
+from .plan import Plan
+from .cache import IndexCache, DistributionCache, MetadataCache
 
 from optparse import OptionParser
 
@@ -19,6 +23,13 @@ def parse_options():
         help='Synchronise every package between the two repositories',
         default=False,
     )
+    parser.add_option(
+        '--serial-file', dest='serial_file',
+        help='Only synchronise packages changed on the source repository since ' \
+             'the changelog serial recorded in this file, then record the ' \
+             'latest serial if none failed. Without a recorded serial every ' \
+             'package is synchronised.',
+    )
     parser.add_option(
         '-e', '--exclude', dest='exclude', action='append', default=[],
         help='Do not synchronise this package between the repositories'
@@ -38,16 +49,21 @@ def parse_options():
     )
 
     parser.add_option(
-        '--destination-url', dest='destination_url',
-        help='The destination repository url - where packages will be uploaded to',
+        '--destination-url', dest='destination_url', action='append', default=[],
+        help='The destination repository url - where packages will be uploaded to. ' \
+             'May be given more than once to synchronise to several repositories, ' \
+             'downloading each distribution only once.',
     )
     parser.add_option(
-        '--destination-username', dest='destination_username',
-        help='The optional username required to access the destination repo',
+        '--destination-username', dest='destination_username', action='append', default=[],
+        help='The optional username required to access the destination repo. ' \
+             'Given once it is used for every destination, otherwise once ' \
+             'per --destination-url, in the same order.',
     )
     parser.add_option(
-        '--destination-password', dest='destination_password',
-        help='Will prompt if --destination-username is provided and this option is not',
+        '--destination-password', dest='destination_password', action='append', default=[],
+        help='Will prompt if --destination-username is provided and this option is not. ' \
+             'Given once or once per --destination-url, as --destination-username.',
     )
 
     parser.add_option(
@@ -63,39 +79,176 @@ def parse_options():
              '1.4.3, 1.4.4 and 1.4.5 are available, only 1.4.5 is synchronised',
     )
 
+    parser.add_option(
+        '--compare-digests', dest='compare_digests', action='store_true', default=False,
+        help='Also synchronise distributions which are on the destination ' \
+             'repository but whose digest there differs from the source',
+    )
+    parser.add_option(
+        '-w', '--workers', dest='workers', type='int', default=1,
+        help='The number of packages to synchronise concurrently (default 1)',
+    )
+    parser.add_option(
+        '--index-concurrency', dest='index_concurrency', type='int', default=0,
+        help='The number of packages whose index pages are fetched at once, ' \
+             'ahead of synchronising them. Can be in the hundreds.',
+    )
+
+    parser.add_option(
+        '--journal', dest='journal',
+        help='Record completed packages and uploads in this file, so that an ' \
+             'interrupted sync can be continued with --resume',
+    )
+    parser.add_option(
+        '--resume', dest='resume', action='store_true', default=False,
+        help='Skip the packages and uploads already recorded in --journal',
+    )
+
+    parser.add_option(
+        '--register-only', dest='register_only', action='store_true', default=False,
+        help='Only register the releases missing from the destination, using ' \
+             'the metadata files the source publishes for its distributions ' \
+             '(PEP 658), without downloading or uploading any distributions',
+    )
+
+    parser.add_option(
+        '--plan', dest='plan',
+        help='Write the distributions that would be synchronised to this file ' \
+             'as JSON, without downloading or uploading anything',
+    )
+    parser.add_option(
+        '--execute-plan', dest='execute_plan',
+        help='Synchronise the distributions listed in a file written by --plan',
+    )
+
+    parser.add_option(
+        '--index-cache', dest='index_cache',
+        default=os.path.expanduser('~/.pkgsync/index-cache'),
+        help='Keep the links from index pages in this directory, and only ' \
+             'fetch pages again if they have changed (default %default)',
+    )
+    parser.add_option(
+        '--index-cache-size', dest='index_cache_size', type='int', default=256,
+        help='The most disk space in MB the index cache may use (default %default)',
+    )
+    parser.add_option(
+        '--no-index-cache', dest='use_index_cache', action='store_false', default=True,
+        help='Fetch and parse every index page in full',
+    )
+
+    parser.add_option(
+        '--download-cache', dest='download_cache',
+        help='Keep downloaded distributions in this directory, keyed by ' \
+             'digest, and take them from there rather than downloading them ' \
+             'again. Can be shared by several runs at once.',
+    )
+    parser.add_option(
+        '--download-cache-size', dest='download_cache_size', type='int', default=1024,
+        help='The most disk space in MB the download cache may use (default %default)',
+    )
+
+    parser.add_option(
+        '--metadata-cache', dest='metadata_cache',
+        default=os.path.expanduser('~/.pkgsync/metadata.sqlite'),
+        help='Keep the metadata of distributions in this database, keyed by ' \
+             'digest, so that distributions synchronised again are not ' \
+             'opened and parsed again (default %default)',
+    )
+    parser.add_option(
+        '--no-metadata-cache', dest='use_metadata_cache', action='store_false', default=True,
+        help='Read the metadata of every distribution from its archive',
+    )
+
     options, args = parser.parse_args()
 
-    required = ('destination_url', 'destination_username')
-    for r in required:
-        if not hasattr(options, r):
+    if not options.destination_url:
+        parser.error('You must provide a destination url')
+
+    for r in ('destination_username', 'destination_password'):
+        given = len(getattr(options, r))
+        if given > 1 and given != len(options.destination_url):
             parser.print_help()
-            raise SystemExit('You must provide a destination url, and a destination username')
+            raise SystemExit('Give --%s once, or once per --destination-url' % r.replace('_', '-'))
+
+    if options.resume and not options.journal:
+        parser.print_help()
+        raise SystemExit('--resume requires a --journal file to resume from')
 
-    if not options.all_packages:
+    if options.serial_file and args:
+        parser.error('Packages cannot be named with --serial-file, which chooses them from the changelog')
+
+    if options.plan and options.execute_plan:
+        parser.print_help()
+        raise SystemExit('--plan and --execute-plan cannot be used together')
+
+    if not (options.all_packages or options.serial_file or options.execute_plan):
         if not len(args):
             parser.print_help()
             raise SystemExit('You must either specify --all or specify individual package names')
 
     return options, args
 
-def configure_repository(url, username=None, password=None):
+def configure_repository(url, username=None, password=None, **kwargs):
     if username and not password:
         password = getpass.getpass("Enter %s's password for %s >" % (username, url))
-    return Repository(url, username=username, password=password)
+    return Repository(url, username=username, password=password, **kwargs)
+
+def for_each(values, count):
+    """ :return: ``count`` values, from a list of one value for all or one each """
+    if not values:
+        return [None] * count
+    if len(values) == 1:
+        return values * count
+    return values
+
+def read_serial(path):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip())
+    except (IOError, ValueError):
+        return None
+
+def write_serial(path, serial):
+    with open(path, 'w') as f:
+        f.write('%d\n' % serial)
 
 def main():
     options, args = parse_options()
 
     logger = logging.getLogger(__name__)
 
-    source = configure_repository(options.source_url, options.source_username, options.source_password)
-    destination = configure_repository(options.destination_url, options.destination_username, options.destination_password)
+    # keep a connection open for each worker that may be using a repository
+    pool_size = max(10, options.workers, options.index_concurrency)
+    if options.use_index_cache:
+        index_cache = IndexCache(options.index_cache, max_bytes=options.index_cache_size * 1024 * 1024)
+    else:
+        index_cache = None
+    source = configure_repository(options.source_url, options.source_username, options.source_password, pool_size=pool_size, index_cache=index_cache)
+    count = len(options.destination_url)
+    destinations = [
+        configure_repository(url, username, password, pool_size=pool_size, index_cache=index_cache)
+        for url, username, password in zip(
+            options.destination_url,
+            for_each(options.destination_username, count),
+            for_each(options.destination_password, count),
+        )
+    ]
 
     ui = StatusReporter()
 
-    if options.all_packages:
+    serial = options.serial_file and read_serial(options.serial_file)
+
+    if options.execute_plan:
+        ui.report('Synchronising packages from plan %s' % options.execute_plan)
+        include_versions = Versions()
+    elif serial is not None:
+        ui.report('Synchronising packages changed since serial %d...' % serial)
+        include_versions = Versions.changed_since(source, serial)
+    elif options.all_packages or options.serial_file:
         ui.report('Synchronising all packages...')
+        serial = options.serial_file and source.last_serial()
         include_versions = Versions.all_packages(source)
+        include_versions.serial = serial
     elif options.versions_file:
         ui.report('Synchronising packages from %s' % options.versions_file)
         include_versions = Versions.from_uri(options.versions_file)
@@ -105,9 +258,49 @@ def main():
 
     include_versions.latest = options.latest
 
+    if options.download_cache:
+        download_cache = DistributionCache(options.download_cache, max_bytes=options.download_cache_size * 1024 * 1024)
+    else:
+        download_cache = None
+
+    if options.use_metadata_cache:
+        metadata_cache = MetadataCache(options.metadata_cache)
+    else:
+        metadata_cache = None
+
+    if options.journal:
+        journal = Journal(options.journal, resume=options.resume)
+    else:
+        journal = NothingJournal()
+
     sync = Sync(
-        source, destination, ui=ui,
+        source, destinations, ui=ui,
         exclude=Versions(options.exclude),
         include=include_versions,
+        workers=options.workers,
+        journal=journal,
+        index_concurrency=options.index_concurrency,
+        compare_digests=options.compare_digests,
+        download_cache=download_cache,
+        metadata_cache=metadata_cache,
+        register_only=options.register_only,
     )
-    sync.sync()
+    try:
+        if options.plan:
+            plan = sync.plan()
+            with open(options.plan, 'w') as f:
+                plan.dump(f)
+        elif options.execute_plan:
+            with open(options.execute_plan, 'r') as f:
+                plan = Plan.from_fp(f)
+            sync.execute(plan)
+        else:
+            sync.sync()
+            # leave the serial where it was if anything failed, so that the
+            # next run tries the failed distributions again
+            if options.serial_file and not sync.failed:
+                write_serial(options.serial_file, include_versions.serial)
+    finally:
+        journal.close()
+        if metadata_cache:
+            metadata_cache.close()
@@ -0,0 +1,142 @@
+import tarfile
+import zipfile
+import zlib
+from email.parser import Parser
+
+import pkginfo
+from pkginfo.distribution import HEADER_ATTRS
+
+class ArchiveMetadata(pkginfo.Distribution):
+    """ Metadata parsed by pkginfo from a PKG-INFO or METADATA file which has
+    already been read out of a distribution archive """
+
+    def __init__(self, filename, data, metadata_version=None):
+        self.filename = filename
+        self.metadata_version = metadata_version
+        self._data = data
+        self.extractMetadata()
+
+    def read(self):
+        return self._data
+
+    def _getHeaderAttrs(self):
+        # the headers of later metadata versions are a superset of 1.2's
+        attrs = HEADER_ATTRS.get(self.metadata_version)
+        if attrs is None and self.metadata_version:
+            attrs = HEADER_ATTRS['1.2']
+        return attrs or []
+
+    def parse(self, data):
+        pkginfo.Distribution.parse(self, data)
+        if self.description is None:
+            # since metadata 2.1 the description may be the message's body
+            # rather than a header
+            if isinstance(data, str):
+                data = data.decode('utf-8', 'replace')
+            body = Parser().parsestr(data).get_payload()
+            if body and body.strip():
+                self.description = body
+
+class SDist(ArchiveMetadata):
+    filetype = 'sdist'
+
+class BDist(ArchiveMetadata):
+    filetype = 'bdist'
+
+class Wheel(ArchiveMetadata):
+    filetype = 'bdist_wheel'
+
+
+def _rank(name, metadata_name='PKG-INFO'):
+    """
+    :return: How good a candidate for the archive's metadata the member
+        called name is, lowest first, or None if it is not one at all. Those
+        ranked 0 are certainly the archive's own metadata, such as
+        ``pkgsync-0.1.0/PKG-INFO`` or the identical copy setuptools keeps in
+        ``pkgsync-0.1.0/pkgsync.egg-info/PKG-INFO``. Others, such as those of
+        vendored packages, are ranked by how deep they are.
+    """
+    parts = name.strip('/').split('/')
+    if parts[-1] != metadata_name:
+        return None
+    if len(parts) <= 2:
+        return 0
+    if len(parts) == 3 and parts[1].endswith(('.egg-info', '.dist-info')):
+        return 0
+    return len(parts)
+
+def _is_metadata(data):
+    return b'Metadata-Version' in data
+
+def _read_tar(path, metadata_name='PKG-INFO'):
+    """ Stream through the members of a tar archive, stopping at the first
+    which is certainly its metadata, and otherwise returning the best found """
+    best, best_rank = None, None
+    archive = tarfile.open(path, 'r|*')
+    try:
+        for member in archive:
+            rank = _rank(member.name, metadata_name)
+            if rank is None or not member.isfile():
+                continue
+            if best_rank is not None and rank >= best_rank:
+                continue
+            data = archive.extractfile(member).read()
+            if not _is_metadata(data):
+                continue
+            if rank == 0:
+                return data
+            best, best_rank = data, rank
+    finally:
+        archive.close()
+    return best
+
+def _read_zip(path, metadata_name='PKG-INFO'):
+    """ Find the metadata in a zip archive's central directory, and read only
+    that member """
+    archive = zipfile.ZipFile(path)
+    try:
+        ranked = sorted(
+            (rank, name) for rank, name in
+            ((_rank(name, metadata_name), name) for name in archive.namelist())
+            if rank is not None
+        )
+        for rank, name in ranked:
+            data = archive.read(name)
+            if _is_metadata(data):
+                return data
+    finally:
+        archive.close()
+    return None
+
+#: ``(extension, reader, metadata file name, metadata class)`` for each kind
+#: of archive, as pkginfo recognises them
+FORMATS = (
+    ('.whl', _read_zip, 'METADATA', Wheel),
+    ('.egg', _read_zip, 'PKG-INFO', BDist),
+    ('.zip', _read_zip, 'PKG-INFO', SDist),
+    ('gz', _read_tar, 'PKG-INFO', SDist),
+    ('bz2', _read_tar, 'PKG-INFO', SDist),
+)
+
+def read_metadata(path):
+    """
+    Read the metadata of a distribution archive, decompressing no more of it
+    than is needed to find its PKG-INFO (or a wheel's METADATA).
+
+    :param path: The path to a tar, zip, egg or wheel archive.
+    :return: An `ArchiveMetadata`, or None if the archive cannot be read or
+        has no metadata.
+    """
+    for extension, reader, metadata_name, cls in FORMATS:
+        if path.lower().endswith(extension):
+            break
+    else:
+        return None
+
+    try:
+        data = reader(path, metadata_name)
+    except (IOError, OSError, EOFError, tarfile.TarError, zipfile.BadZipfile, zlib.error):
+        return None
+    if data is None:
+        return None
+    return cls(path, data)
@@ -0,0 +1,343 @@
+import os
+import time
+import json
+import errno
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+
+class DirectoryCache(object):
+    """ Files kept in a directory up to a budget of ``max_bytes``, beyond
+    which the least recently used (by modification time) are removed. Files
+    are written under a temporary name and renamed into place, so several
+    processes can share the directory without seeing partial files.
+
+    The size and last use of each entry are kept in memory as entries are
+    added and used, rather than read from disk each time, and read from disk
+    again every ``rescan_interval`` seconds to count the entries other
+    processes have added meanwhile. """
+
+    def __init__(self, directory, max_bytes, rescan_interval=60):
+        """
+        :param directory: The directory entries are kept in; created if it
+            does not exist.
+        :param max_bytes: The most disk space entries may use.
+        :param rescan_interval: The most seconds between reading the size and
+            last use of the entries from disk.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self._size = 0
+        self._index = None # path: (last used, size)
+        self._scanned = None
+        self._lock = threading.Lock()
+        _makedirs(directory)
+
+    def _touch(self, path):
+        """ Mark the file at path as the most recently used """
+        try:
+            os.utime(path, None)
+        except OSError:
+            return
+        with self._lock:
+            if self._index is not None and path in self._index:
+                self._index[path] = (time.time(), self._index[path][1])
+
+    def _tmp_path(self, path):
+        _makedirs(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        return tmp_path
+
+    def _added(self, path):
+        """ Account for a file just renamed into place, evicting if need be """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._index is None or time.time() - self._scanned >= self.rescan_interval:
+                self._load()
+            previous = self._index.get(path, (None, 0))[1]
+            self._index[path] = (time.time(), size)
+            self._size += size - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _load(self):
+        self._scanned = time.time()
+        self._index = dict((path, (mtime, size)) for mtime, size, path in self._entries())
+        self._size = sum(size for mtime, size in self._index.values())
+
+    def _entries(self):
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue # removed by another process
+                yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self):
+        """ Remove the least recently used entries until there is room """
+        for path, (mtime, size) in sorted(self._index.items(), key=lambda item: item[1]):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass # already removed by another process
+            del self._index[path]
+            self._size -= size
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.directory)
+
+
+class IndexCache(DirectoryCache):
+    """ An on-disk cache of the links parsed from repository index pages,
+    keyed by url. Each entry keeps the ``ETag`` and ``Last-Modified`` headers
+    the page was served with so that it can be fetched again conditionally,
+    and its links reused without parsing the page if it has not changed.
+
+    Once the entries take up more than ``max_bytes`` the least recently used
+    are removed. """
+
+    #: The format of the entries, changed whenever the links parsed from
+    #: pages gain or lose keys; entries in another format are ignored
+    FORMAT = 2
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, rescan_interval=60):
+        DirectoryCache.__init__(self, directory, max_bytes, rescan_interval)
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url).hexdigest() + '.json')
+
+    def get(self, url):
+        """
+        :param url: The url of an index page.
+        :return: The cached entry for the url, a dictionary with ``etag``,
+            ``last_modified`` and ``links`` keys, or None.
+        """
+        path = self._path(url)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('url') != url or entry.get('format') != self.FORMAT:
+            return None
+        self._touch(path)
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        :param entry: An entry returned by `get`, or None.
+        :return: The headers that ask for the page only if it has changed.
+        """
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, response, links):
+        """
+        :param url: The url of an index page.
+        :param response: The `requests` response the page was fetched with.
+        :param links: The links parsed from the page.
+        """
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        if not (etag or last_modified):
+            return # the page can never be fetched conditionally
+
+        path = self._path(url)
+        tmp_path = self._tmp_path(path)
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'url': url,
+                'format': self.FORMAT,
+                'etag': etag,
+                'last_modified': last_modified,
+                'links': links,
+            }, f)
+        os.rename(tmp_path, path)
+        self._added(path)
+
+
+class DistributionCache(DirectoryCache):
+    """ An on-disk, content-addressed cache of downloaded distributions,
+    keyed by digest, so that a distribution synchronised to several
+    destinations or by several runs is only downloaded once. Distributions
+    are hard-linked in and out of the cache where possible, and copied
+    otherwise. Since the cache is only an optimisation, a distribution which
+    cannot be added to it is simply not cached.
+
+    Once the entries take up more than ``max_bytes`` the least recently used
+    are removed. """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, rescan_interval=60):
+        DirectoryCache.__init__(self, directory, max_bytes, rescan_interval)
+
+    def _path(self, algorithm, digest):
+        digest = digest.lower()
+        return os.path.join(self.directory, algorithm, digest[:2], digest)
+
+    def _link(self, source, destination):
+        try:
+            os.link(source, destination)
+        except OSError:
+            # on another filesystem, one without hard links, or where they
+            # are not permitted
+            shutil.copy2(source, destination)
+
+    def get(self, algorithm, digest, save_to):
+        """
+        :param algorithm: The name of the hash, such as ``md5``.
+        :param digest: The hex digest of the distribution.
+        :param save_to: The path the distribution should be placed at.
+        :return: True if the distribution was in the cache and is now at
+            save_to, otherwise False.
+        """
+        path = self._path(algorithm, digest)
+        if os.path.exists(save_to):
+            os.unlink(save_to)
+        try:
+            self._link(path, save_to)
+        except (IOError, OSError):
+            return False # not cached, or evicted by another process
+        self._touch(path)
+        return True
+
+    def store(self, algorithm, digest, path):
+        """
+        :param algorithm: The name of the hash, such as ``md5``.
+        :param digest: The hex digest of the file, already verified.
+        :param path: The path of the downloaded distribution.
+        """
+        cached_path = self._path(algorithm, digest)
+        if os.path.exists(cached_path):
+            self._touch(cached_path)
+            return
+        tmp_path = None
+        try:
+            tmp_path = self._tmp_path(cached_path)
+            os.unlink(tmp_path)
+            self._link(path, tmp_path)
+            os.rename(tmp_path, cached_path)
+        except (IOError, OSError):
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        self._added(cached_path)
+
+
+class MetadataCache(object):
+    """ An sqlite database of the fields distributions are registered and
+    uploaded with, keyed by the sha256 digest of the distribution, so that a
+    distribution synchronised again need not have its archive opened and its
+    metadata parsed. The fields which depend on the file itself, its content
+    and md5 digest, are not kept, and the register fields are only kept once
+    the distribution has been registered. The database may be shared by several
+    threads and processes. """
+
+    #: The format of the stored fields, changed whenever `Metadata`'s fix-ups
+    #: or the fields it registers or uploads with change. Each format is kept
+    #: in a table of its own, so that fields stored in another are never used.
+    VERSION = 4
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS %s (
+            digest TEXT PRIMARY KEY,
+            register TEXT,
+            upload TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, path, timeout=30):
+        """
+        :param path: The path of the database file; created if it does not
+            exist.
+        :param timeout: The number of seconds to wait for another process
+            writing to the database.
+        """
+        self.path = path
+        self.table = 'metadata_v%d' % self.VERSION
+        _makedirs(os.path.dirname(os.path.abspath(path)))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        with self._lock:
+            self._db.execute(self.SCHEMA % self.table)
+            self._db.commit()
+
+    def get(self, digest):
+        """
+        :param digest: The sha256 hex digest of a distribution.
+        :return: A tuple of the ``register`` and ``upload`` fields stored for
+            the distribution, the first of which is None if the register
+            fields are not stored, or None if nothing is.
+        :raises: `sqlite3.Error` if the database cannot be read, such as when
+            another process holds it locked for longer than the timeout.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT register, upload FROM %s WHERE digest = ?' % self.table, (digest,)
+            ).fetchone()
+        if row is None:
+            return None
+        register, upload = row
+        return register and json.loads(register), json.loads(upload)
+
+    def store(self, digest, register, upload):
+        """
+        :param digest: The sha256 hex digest of a distribution.
+        :param register: The fields the distribution is registered with, or
+            None if they are not yet known.
+        :param upload: The fields the distribution is uploaded with, other than
+            its content and md5 digest.
+        :raises: `sqlite3.Error` if the database cannot be written to.
+        """
+        if register is not None:
+            register = json.dumps(register)
+        row = (digest, register, json.dumps(upload))
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO %s VALUES (?, ?, ?)' % self.table, row)
+            self._db.commit()
+
+    def store_register(self, digest, register):
+        """
+        Add the register fields to those already stored for a distribution.
+
+        :param digest: The sha256 hex digest of a distribution.
+        :param register: The fields the distribution is registered with.
+        :raises: `sqlite3.Error` if the database cannot be written to.
+        """
+        with self._lock:
+            self._db.execute(
+                'UPDATE %s SET register = ? WHERE digest = ?' % self.table,
+                (json.dumps(register), digest),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __repr__(self):
+        return '<MetadataCache: %s>' % self.path
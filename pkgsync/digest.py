@@ -1,11 +1,85 @@
 import hashlib
 
-class Md5MismatchException(Exception):
+#: The hashes a distribution's digest may be given in, strongest first
+ALGORITHMS = ('sha512', 'sha384', 'sha256', 'sha224', 'sha1', 'md5')
+
+#: The hashes always calculated for a downloaded distribution: md5 for the
+#: upload request, and sha256 to verify and cache it by
+DEFAULT_ALGORITHMS = ('md5', 'sha256')
+
+def parse_fragment(fragment):
+    """
+    :param fragment: The fragment of a distribution's url, such as
+        ``sha256=<hexdigest>``.
+    :return: A dictionary of the hex digest keyed by hash name, which is
+        empty if the fragment does not name a known hash.
+    """
+    algorithm, sep, digest = fragment.partition('=')
+    algorithm = algorithm.lower()
+    if not (sep and digest and algorithm in ALGORITHMS):
+        return {}
+    return {algorithm: digest.lower()}
+
+class DigestMismatchException(Exception):
+    """
+    A digest of the file at the given path does not match the one given
+    """
+
+class Md5MismatchException(DigestMismatchException):
     """
     The given md5sum does not match the md5sum of the file at the given path
     """
 
+class StreamingDigestChecker(object):
+    """ Calculates several digests of data at once as it passes through, for
+    checking against those expected once it has all been seen """
+
+    def __init__(self, path, expected, algorithms=DEFAULT_ALGORITHMS):
+        """
+        :param path: The path the data is being saved to.
+        :param expected: A dictionary of the expected hex digests keyed by
+            hash name. Those for hashes not in `ALGORITHMS` are ignored.
+        :param algorithms: The hashes calculated whether or not a digest is
+            expected for them.
+        """
+        self.path = path
+        self.expected = dict(
+            (name, digest) for name, digest in (expected or {}).items()
+            if name in ALGORITHMS and digest
+        )
+        names = set(algorithms) | set(self.expected)
+        self.hashes = dict((name, hashlib.new(name)) for name in names)
+
+    def update(self, chunk):
+        for h in self.hashes.values():
+            h.update(chunk)
+
+    def hexdigest(self, name='md5'):
+        return self.hashes[name].hexdigest()
+
+    def hexdigests(self):
+        """ :return: Every calculated hex digest, keyed by hash name """
+        return dict((name, h.hexdigest()) for name, h in self.hashes.items())
+
+    def check(self):
+        """ :raises DigestMismatchException: if any expected digest differs """
+        for name, expected in self.expected.items():
+            if self.hexdigest(name) != expected.lower():
+                if name == 'md5':
+                    raise Md5MismatchException(self.path, expected)
+                raise DigestMismatchException(self.path, name, expected)
+
+def file_digests(path, algorithms=DEFAULT_ALGORITHMS, chunk_size=64 * 1024):
+    """ :return: The hex digests of the file at path, keyed by hash name,
+    calculated together in a single read of the file """
+    checker = StreamingDigestChecker(path, None, algorithms)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checker.update(chunk)
+    return checker.hexdigests()
+
 class IteratingMd5Checker(object):
+    """ Checks the md5sum of a file already on disk against an expected one """
 
     def __init__(self, path, against):
         self.path = path
@@ -17,8 +91,4 @@ class IteratingMd5Checker(object):
             raise Md5MismatchException(self.path, self.against)
 
     def _digest(self):
-        md5 = hashlib.md5()
-        with open(self.path,'rb') as f:
-            for chunk in iter(lambda: f.read(128*md5.block_size), b''):
-                md5.update(chunk)
-        return md5.hexdigest()
+        return file_digests(self.path, ('md5',))['md5']
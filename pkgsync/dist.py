@@ -1,45 +1,158 @@
 import os
-from hashlib import md5
+import sqlite3
+import threading
 
-from .meta import Metadata, OldStyleMetadata
+from .digest import file_digests, DEFAULT_ALGORITHMS
+from .meta import Metadata, OldStyleMetadata, CachedMetadata
+from .archive import ArchiveMetadata
 from .exceptions import InvalidDistribution
 
+class Content(object):
+    """ The content of a distribution file, read from disk a chunk at a time
+    as it is iterated over rather than held in memory """
+
+    def __init__(self, path, chunk_size=64 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return os.path.getsize(self.path)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                yield chunk
+
+    def endswith(self, suffix):
+        """ As ``str.endswith``, reading only the end of the file """
+        if len(suffix) > len(self):
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(-len(suffix), os.SEEK_END)
+            return f.read() == suffix
+
+    def read(self):
+        """ :return: The whole content as a string, for when it is needed at once """
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def __repr__(self):
+        return '<Content: %s>' % self.path
+
+
 class Distribution(object):
 
-    def __init__(self, path):
+    def __init__(self, path, md5_digest=None, digests=None, metadata_cache=None):
+        """
+        :param path: The path to the distribution file.
+        :param md5_digest: The md5sum of the file, if it is already known.
+        :param digests: Hex digests of the file keyed by hash name, such as
+            those calculated while it was downloaded.
+        :param metadata_cache: A `MetadataCache` which the distribution's
+            metadata is looked up in by its sha256 digest before its archive
+            is opened, and which it is added to otherwise.
+        """
         self.path = path
-        try:
-            self.meta = Metadata(self)
-        except InvalidDistribution:
-            self.meta = OldStyleMetadata(self)
+        self.digests = dict(digests or {})
+        if md5_digest:
+            self.digests['md5'] = md5_digest
+        self.metadata_cache = metadata_cache
+        self._meta = None
+        self._meta_lock = threading.Lock()
 
-        self._content = None
-        self._md5_digest = None
+    @property
+    def meta(self):
+        """ The distribution's metadata, read from its archive, or taken from
+        the metadata cache, the first time it is needed """
+        with self._meta_lock:
+            if self._meta is None:
+                self._meta = self._metadata()
+        return self._meta
 
-    def _load(self):
-        f = open(self.path, 'rb')
-        self._content = f.read()
-        f.close()
+    def _metadata(self):
+        """ Look the metadata up in the cache, if there is one, and otherwise
+        parse it from the archive. The cache is only an optimisation, so if
+        its database cannot be used the archive is parsed regardless. """
+        if self.metadata_cache:
+            try:
+                cached = self.metadata_cache.get(self.sha256_digest)
+            except sqlite3.Error:
+                cached = None
+            if cached:
+                return CachedMetadata(self, *cached, cache=self.metadata_cache)
 
-    def _calculate_digest(self):
-        """ Don't iterate over chunks because it's already in mem to upload """
-        self._md5_digest = md5(self.content).hexdigest()
+        meta = self.parse_metadata()
+        if not self.metadata_cache:
+            return meta
+
+        # only the upload fields are stored, the register fields being stored
+        # if and when the distribution is registered
+        upload = CachedMetadata.upload_fields(meta)
+        try:
+            self.metadata_cache.store(self.sha256_digest, None, upload)
+        except sqlite3.Error:
+            return meta
+        return CachedMetadata(self, None, upload, cache=self.metadata_cache, metadata=meta)
+
+    def parse_metadata(self):
+        """ :return: The distribution's metadata, read from its archive
+        regardless of the metadata cache """
+        try:
+            return Metadata(self)
+        except InvalidDistribution:
+            return OldStyleMetadata(self)
+
+    def _calculate_digests(self, *names):
+        """ Calculate the md5 and sha256 digests, and any others named,
+        together in one read of the file """
+        calculated = file_digests(self.path, DEFAULT_ALGORITHMS + names)
+        calculated.update(self.digests)
+        self.digests = calculated
 
     @property
     def content(self):
-        if not self._content:
-            self._load()
-        return self._content
+        """ The distribution's `Content`, which reads the file in chunks """
+        return Content(self.path)
 
     @property
     def basename(self):
         return os.path.basename(self.path)
 
+    def digest(self, name):
+        """
+        :param name: The name of a hash, such as ``md5`` or ``sha256``.
+        :return: The hex digest of the distribution.
+        """
+        if not name in self.digests:
+            self._calculate_digests(name)
+        return self.digests[name]
+
     @property
     def md5_digest(self):
-        if not self._md5_digest:
-            self._calculate_digest()
-        return self._md5_digest
+        return self.digest('md5')
+
+    @property
+    def sha256_digest(self):
+        return self.digest('sha256')
 
     def __repr__(self):
         return '<Distribution: %s>' % self.path
+
+
+class MetadataDistribution(object):
+    """ A distribution known only by its metadata, such as that fetched from
+    a PEP 658 metadata file, which can be registered but not uploaded """
+
+    def __init__(self, basename, data):
+        """
+        :param basename: The filename of the distribution.
+        :param data: The contents of the distribution's PKG-INFO or METADATA.
+        """
+        if not b'Metadata-Version' in data:
+            raise InvalidDistribution(basename)
+        self.path = None
+        self.basename = basename
+        self.meta = Metadata(self, raw=ArchiveMetadata(basename, data))
+
+    def __repr__(self):
+        return '<MetadataDistribution: %s>' % self.basename
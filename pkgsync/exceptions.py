@@ -3,3 +3,13 @@ class InvalidDistribution(Exception):
 
 class InvalidRemoteDistribution(Exception):
     pass
+
+class MetadataUnavailable(InvalidDistribution):
+    """ The repository publishes no metadata file for the distribution """
+
+class UploadFailed(InvalidDistribution):
+    """ A destination repository did not accept the distribution """
+
+class DownloadFailed(InvalidDistribution):
+    """ The repository answered a request for the distribution with a status
+    other than the file, or the rest of it """
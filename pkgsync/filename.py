@@ -0,0 +1,92 @@
+import re
+import threading
+
+def normalize(package_name):
+    """ :return: The package name lower-cased with runs of ``-``, ``_`` and
+        ``.`` replaced by a single ``-``, so that equivalent names compare equal """
+    return re.sub(r'[-_.]+', '-', package_name).lower()
+
+
+class FilenameParser(object):
+    """ Splits distribution filenames into their package name, version and
+    other parts. Understands sdists (``.zip``, ``.tgz``, ``.tar.gz`` and
+    ``.tar.bz2``), eggs and wheels::
+
+        >> FilenameParser().parse('pkgsync-0.1.0-py2.py3-none-any.whl', 'pkgsync')
+        {'version': '0.1.0', 'build': None, 'pyversion': 'py2.py3',
+         'abi': 'none', 'platform': 'any', 'extension': '.whl'}
+
+    The patterns for recently seen package names are compiled once, and
+    filenames parsed once, no matter how many times they are asked for. """
+
+    wheel = re.compile(
+        r'^(?P<name>[^-]+)-(?P<version>[^-]+)'
+        r'(-(?P<build>\d[^-]*))?'
+        r'-(?P<pyversion>[^-]+)-(?P<abi>[^-]+)-(?P<platform>[^-]+)'
+        r'(?P<extension>\.whl)$'
+    )
+    egg = r'^%s-(?P<version>.*)-(?P<pyversion>py[\d\.]+)(-(?P<platform>.+))?(?P<extension>\.egg)$'
+    sdist = r'^%s-(?P<version>.*)(?P<extension>\.zip|\.tgz|\.tar\.gz|\.tar\.bz2)$'
+
+    def __init__(self, max_cached=100000, max_patterns=1000):
+        """
+        :param max_cached: The number of parsed filenames remembered. Once
+            there are more, all are forgotten and remembering starts again.
+        :param max_patterns: The number of package names whose compiled
+            patterns are remembered, forgotten in the same way.
+        """
+        self.max_cached = max_cached
+        self.max_patterns = max_patterns
+        self._patterns = {}
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def _name_patterns(self, package_name):
+        patterns = self._patterns.get(package_name)
+        if patterns is None:
+            # any run of separators matches any other, as in normalize
+            name = r'[-_.]+'.join(re.escape(part) for part in re.split(r'[-_.]+', package_name))
+            patterns = (
+                re.compile(self.egg % name, re.IGNORECASE),
+                re.compile(self.sdist % name, re.IGNORECASE),
+            )
+            with self._lock:
+                if len(self._patterns) >= self.max_patterns:
+                    self._patterns.clear()
+                self._patterns[package_name] = patterns
+        return patterns
+
+    def _parse(self, basename, package_name):
+        if basename.endswith('.whl'):
+            r = self.wheel.search(basename)
+            if r and normalize(r.group('name')) == normalize(package_name):
+                parsed = r.groupdict()
+                del parsed['name']
+                return parsed
+            return None
+
+        egg, sdist = self._name_patterns(package_name)
+        r = (egg if basename.endswith('.egg') else sdist).search(basename)
+        if r:
+            return r.groupdict()
+
+    def parse(self, basename, package_name):
+        """
+        :param basename: The filename of a distribution.
+        :param package_name: The name of the package it should be for.
+        :return: A dictionary of the parts of the filename, with at least
+            ``version`` and ``extension`` keys, or None if it is not a
+            distribution of the given package.
+        """
+        key = (basename, package_name)
+        try:
+            parsed = self._parsed[key]
+        except KeyError:
+            parsed = self._parse(basename, package_name)
+            with self._lock:
+                if len(self._parsed) >= self.max_cached:
+                    self._parsed.clear()
+                self._parsed[key] = parsed
+        return parsed and dict(parsed)
+
+parser = FilenameParser()
@@ -0,0 +1,111 @@
+import os
+import threading
+
+class NothingJournal(object):
+    """ A journal which records nothing and for which nothing is done """
+
+    def package_done(self, spec):
+        pass
+
+    def uploaded(self, basename, destination=None):
+        pass
+
+    def is_package_done(self, spec):
+        return False
+
+    def has_uploaded(self, basename, destination=None):
+        return False
+
+    def close(self):
+        pass
+
+
+class Journal(object):
+    """ An append-only record of the packages and distributions a `Sync` has
+    completed, so that an interrupted sync can be resumed without fetching
+    the index pages for packages that are already synchronised. Each line of
+    the file is an entry type and a value separated by a tab::
+
+        upload	pkgsync-0.1.0.tar.gz
+        upload	pkgsync-0.1.0.tar.gz	https://eggsample.com
+        package	pkgsync>=0.1
+
+    Uploads to a particular destination repository are recorded with its
+    url after the distribution's basename.
+    """
+
+    PACKAGE = 'package'
+    UPLOAD = 'upload'
+
+    def __init__(self, path, resume=False):
+        """
+        :param path: The path of the journal file.
+        :param resume: If True, entries already in the file are loaded and
+            new ones appended. Otherwise the file is started afresh.
+        """
+        self.path = path
+        self.packages = set()
+        self.uploads = set()
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            self._load()
+        self._fp = open(path, 'a' if resume else 'w')
+
+    def _load(self):
+        """ Load the entries in the file, then truncate it after the last
+        complete one, so that new entries are not appended to a partially
+        written entry from an interrupted run """
+        entries = {self.PACKAGE: self.packages, self.UPLOAD: self.uploads}
+        complete = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                complete += len(line)
+                try:
+                    kind, value = line.rstrip('\n').split('\t', 1)
+                    entries[kind].add(value)
+                except (ValueError, KeyError):
+                    continue
+        if complete < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+
+    def _write(self, kind, value):
+        with self._lock:
+            self._fp.write('%s\t%s\n' % (kind, value))
+            self._fp.flush()
+
+    def package_done(self, spec):
+        """ Record that every distribution for a release specification is done """
+        self.packages.add(spec)
+        self._write(self.PACKAGE, spec)
+
+    def _upload_key(self, basename, destination):
+        if destination is None:
+            return basename
+        return '%s\t%s' % (basename, destination)
+
+    def uploaded(self, basename, destination=None):
+        """
+        Record that a distribution has been uploaded to the destination
+
+        :param destination: The url of the destination repository, if there
+            is more than one.
+        """
+        key = self._upload_key(basename, destination)
+        self.uploads.add(key)
+        self._write(self.UPLOAD, key)
+
+    def is_package_done(self, spec):
+        return spec in self.packages
+
+    def has_uploaded(self, basename, destination=None):
+        return self._upload_key(basename, destination) in self.uploads
+
+    def close(self):
+        self._fp.close()
+
+    def __repr__(self):
+        return '<Journal: %s>' % self.path
@@ -0,0 +1,94 @@
+import codecs
+from HTMLParser import HTMLParser, HTMLParseError
+
+class LinkParser(HTMLParser):
+    """ A lenient, incremental parser which collects the ``href`` and text of
+    every ``<a>`` element in an html page, however badly formed the rest of
+    the page is. Feed it the page a piece at a time and take the links found
+    so far with `pop_links`. """
+
+    def __init__(self, attributes=()):
+        """
+        :param attributes: The names of any other attributes of each ``<a>``
+            element to collect, such as ``data-core-metadata``.
+        """
+        HTMLParser.__init__(self)
+        self.attributes = attributes
+        self._links = []
+        self._href = None
+        self._text = None
+        self._attrs = None
+
+    def _end_link(self):
+        if self._text is not None:
+            link = (self._href, u''.join(self._text).strip())
+            if self.attributes:
+                link += (self._attrs,)
+            self._links.append(link)
+        self._href = None
+        self._text = None
+        self._attrs = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._end_link() # an unclosed <a> ends at the next one
+            attrs = dict(attrs)
+            self._href = attrs.get('href') or None
+            self._text = []
+            self._attrs = dict(
+                (name, attrs[name]) for name in self.attributes if name in attrs
+            )
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._end_link()
+
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(self.unescape('&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(self.unescape('&#%s;' % name))
+
+    def close(self):
+        HTMLParser.close(self)
+        self._end_link()
+
+    def pop_links(self):
+        """ :return: A list of ``(href, text)`` tuples found since last called,
+        or ``(href, text, attributes)`` if other attributes are collected """
+        links, self._links = self._links, []
+        return links
+
+
+def iter_links(chunks, encoding='utf-8', attributes=()):
+    """
+    :param chunks: An iterable of byte strings which together make up an
+        html page, such as ``response.iter_content()``.
+    :param encoding: The encoding of the page.
+    :param attributes: The names of other attributes to collect from each
+        link, as for `LinkParser`.
+    :return: yields an ``(href, text)`` tuple for each link in the page as
+        soon as the chunk containing its closing tag has been read, with a
+        dictionary of any of the given attributes the link has as a third
+        item if attributes were named.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    parser = LinkParser(attributes)
+    for chunk in chunks:
+        try:
+            parser.feed(decoder.decode(chunk))
+        except HTMLParseError:
+            break # give up on the rest of the page, keeping what was found
+        for link in parser.pop_links():
+            yield link
+    try:
+        parser.feed(decoder.decode('', final=True))
+        parser.close()
+    except HTMLParseError:
+        pass
+    for link in parser.pop_links():
+        yield link
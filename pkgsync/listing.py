@@ -0,0 +1,100 @@
+from .exceptions import InvalidRemoteDistribution
+from .remote import RemoteDistribution, path_basename, known_digests, same_content
+from . import filename
+
+class ListedDistribution(object):
+    """ A distribution in a `Listing`, holding only what is needed to select
+    and compare it. Anything else, such as `download` or `url`, is looked up
+    on a `RemoteDistribution` created for it the first time it is needed. """
+
+    __slots__ = ('listing', 'path', 'version', 'extension', 'hashes', 'size', 'metadata', '_remote')
+
+    def __init__(self, listing, path, version, extension, hashes=None, size=None, metadata=None):
+        self.listing = listing
+        self.path = path
+        self.version = version
+        self.extension = extension
+        self.hashes = hashes
+        self.size = size
+        self.metadata = metadata
+        self._remote = None
+
+    @property
+    def package_name(self):
+        return self.listing.package_name
+
+    @property
+    def repository(self):
+        return self.listing.repository
+
+    @property
+    def basename(self):
+        return path_basename(self.path)
+
+    @property
+    def md5_digest(self):
+        return self.digests.get('md5')
+
+    @property
+    def digests(self):
+        """ Every hex digest known for this distribution, keyed by hash name """
+        return known_digests(self.path, self.hashes)
+
+    def same_content(self, other):
+        """ As `RemoteDistribution.same_content` """
+        return same_content(self, other)
+
+    @property
+    def remote(self):
+        """ The full `RemoteDistribution` for this distribution """
+        if self._remote is None:
+            self._remote = RemoteDistribution(
+                self.listing.repository, self.path, self.listing.package_name,
+                hashes=self.hashes, size=self.size, metadata=self.metadata,
+            )
+        return self._remote
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.remote, name)
+
+    def __repr__(self):
+        return '<ListedDistribution: %s>' % self.basename
+
+
+class Listing(list):
+    """ Every distribution of a package on a repository, as returned by
+    `Repository.all_distributions`. The repository and package name are held
+    once for the whole listing rather than by each distribution, and each
+    distribution is a `ListedDistribution`, so that the listings for many
+    packages can be kept in memory at once. """
+
+    def __init__(self, repository, package_name):
+        super(Listing, self).__init__()
+        self.repository = repository
+        self.package_name = package_name
+
+    def add(self, path, hashes=None, size=None, metadata=None):
+        """
+        :param path: The path to the distribution, as for `RemoteDistribution`
+        :param hashes: Hex digests of the distribution keyed by hash name.
+        :param size: The size of the distribution in bytes, if known.
+        :param metadata: The digests of the distribution's metadata file, if
+            one is published.
+        :raises InvalidRemoteDistribution: If the distribution's filename
+            cannot be parsed.
+        :return: The `ListedDistribution` added.
+        """
+        parsed = filename.parser.parse(path_basename(path), self.package_name)
+        if not parsed:
+            raise InvalidRemoteDistribution(path)
+        listed = ListedDistribution(
+            self, path, parsed.get('version'), parsed.get('extension'),
+            hashes=hashes or None, size=size, metadata=metadata,
+        )
+        self.append(listed)
+        return listed
+
+    def __repr__(self):
+        return '<Listing: %s, %d distribution(s)>' % (self.package_name, len(self))
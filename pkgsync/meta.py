@@ -1,17 +1,37 @@
 import re
+import sqlite3
+import threading
 import pkginfo
 
 from .exceptions import InvalidDistribution
+from .archive import read_metadata
+from .filename import parser
 
 class Metadata(object):
     """An adapter around pkginfo with better support for classifiers and
     keywords. Also crucially adds upload and register methods for creating a
     distutils-compatible representation of the package suitable for upload to a
-    python distribution repository"""
-
-    def __init__(self, dist):
+    python distribution repository. Classifiers and keywords are only fixed
+    up when something other than the name and version used for an upload is
+    needed."""
+
+    def __init__(self, dist, raw=None):
+        """
+        :param dist: The `Distribution` the metadata is for.
+        :param raw: The pkginfo metadata, if it has already been read, for
+            instance from a PEP 658 metadata file. Otherwise it is read from
+            the distribution's archive.
+        """
         self.dist = dist
-        self._meta = self._introspect()
+        self._raw = raw if raw is not None else self._introspect()
+        self._fixed = False
+
+    @property
+    def _meta(self):
+        if not self._fixed:
+            self._fix(self._raw)
+            self._fixed = True
+        return self._raw
 
     def __getattr__(self, name):
         if hasattr(self._meta, name):
@@ -22,11 +42,16 @@ class Metadata(object):
         return re.findall('\nClassifier: (.* :: .*)', metadata_dump)
 
     def _introspect(self):
-        """ Get the pkginfo metadata and monkeypatch where required """
-        metadata = pkginfo.get_metadata(self.dist.path)
+        """ Get the pkginfo metadata. The archive's PKG-INFO is read directly
+        where possible, with pkginfo's own search of the archive as a
+        fallback """
+        metadata = read_metadata(self.dist.path) or pkginfo.get_metadata(self.dist.path)
         if not metadata:
             raise InvalidDistribution(self.dist.path)
+        return metadata
 
+    def _fix(self, metadata):
+        """ Monkeypatch the pkginfo metadata where required """
         metadata_full = metadata.read()
         if metadata.classifiers == () and 'Classifier' in metadata_full:
             metadata.classifiers = self._parse_classifiers(metadata_full)
@@ -36,17 +61,25 @@ class Metadata(object):
             if len(keywords) == 1:
                 keywords = metadata.keywords.split(' ')
             metadata.keywords = keywords
-        return metadata
+
+    def _pyversion(self, filetype):
+        """ :return: The python tag from a wheel's filename, such as
+        ``py2.py3``, which repositories require of a wheel upload """
+        if filetype != 'bdist_wheel':
+            return ''
+        parsed = parser.parse(self.dist.basename, self._raw.name)
+        return parsed['pyversion'] if parsed else ''
 
     def upload(self):
         """ Build a dictionary suitable for a distutils upload request """
+        filetype = getattr(self._raw, 'filetype', self._raw.__class__.__name__.lower())
         return {
             ':action': 'file_upload',
             'protocol_version': '1',
-            'name': self._meta.name,
-            'version': self._meta.version,
-            'filetype': self._meta.__class__.__name__.lower(),
-            'pyversion': '',
+            'name': self._raw.name,
+            'version': self._raw.version,
+            'filetype': filetype,
+            'pyversion': self._pyversion(filetype),
             'md5_digest': self.dist.md5_digest,
             'content': (self.dist.basename, self.dist.content),
         }
@@ -126,3 +159,66 @@ class OldStyleMetadata(object):
             'requires': (),
             'obsoletes': (),
         }
+
+class CachedMetadata(object):
+    """ Metadata for a distribution as kept in a `MetadataCache`, which
+    provides the same upload and register dictionaries as `Metadata` without
+    opening the distribution's archive. The register fields are only worked
+    out, and added to the cache, the first time they are needed, so that a
+    distribution which is only uploaded is never fixed up. """
+
+    #: The upload fields which depend on the distribution file itself, and so
+    #: are not cached
+    FILE_FIELDS = ('md5_digest', 'content')
+
+    def __init__(self, dist, register, upload, cache=None, metadata=None):
+        """
+        :param dist: The `Distribution` the metadata is for.
+        :param register: The cached register fields, or None if they are not
+            yet cached.
+        :param upload: The cached upload fields.
+        :param cache: The `MetadataCache` the register fields are added to
+            once they are worked out.
+        :param metadata: The `Metadata` already parsed from the distribution,
+            if it has been, from which the register fields are taken.
+            Otherwise the distribution's archive is parsed for them.
+        """
+        self.dist = dist
+        self.cache = cache
+        self._register = register
+        self._upload = upload
+        self._metadata = metadata
+        self._lock = threading.Lock()
+
+    @classmethod
+    def upload_fields(cls, metadata):
+        """
+        :param metadata: A `Metadata` or `OldStyleMetadata` object.
+        :return: Those of its upload fields which can be cached.
+        """
+        return dict(
+            (key, value) for key, value in metadata.upload().items()
+            if not key in cls.FILE_FIELDS
+        )
+
+    def upload(self):
+        upload = dict(
+            (key, value.encode('utf-8') if isinstance(value, unicode) else value)
+            for key, value in self._upload.items()
+        )
+        upload['md5_digest'] = self.dist.md5_digest
+        upload['content'] = (self.dist.basename, self.dist.content)
+        return upload
+
+    def register(self):
+        with self._lock:
+            if self._register is None:
+                metadata = self._metadata or self.dist.parse_metadata()
+                self._register = metadata.register()
+                self._metadata = None
+                if self.cache:
+                    try:
+                        self.cache.store_register(self.dist.sha256_digest, self._register)
+                    except sqlite3.Error:
+                        pass
+        return dict(self._register)
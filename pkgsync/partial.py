@@ -0,0 +1,171 @@
+import os
+import errno
+import fcntl
+
+class PartialFile(object):
+    """ A download in progress, kept beside where it will finally be saved
+    so that an interrupted download can be resumed with a Range request
+    rather than started again. The partial file is at ``path + '.part'`` and
+    the validator the server sent with it (a strong ETag, or else the
+    Last-Modified date) at ``path + '.part.validator'``.
+
+    Several processes may download to the same directory, so the partial
+    file is locked while it is written to. A process which finds it locked
+    downloads to a partial file of its own instead, which is removed rather
+    than kept for resuming if the download does not complete. """
+
+    def __init__(self, path):
+        """ :param path: The path the completed download will be saved to """
+        self.path = path
+        self.part_path = path + '.part'
+        self._fd = None
+
+    @property
+    def validator_path(self):
+        return self.part_path + '.validator'
+
+    @property
+    def shared(self):
+        """ Whether the partial file is the one kept for later runs to resume """
+        return self.part_path == self.path + '.part'
+
+    def _lock(self, path):
+        """ :return: A descriptor holding an exclusive lock on the file at
+        path, created if need be, or None if another process holds one """
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError, e:
+                os.close(fd)
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                return None
+            try:
+                if os.path.samestat(os.fstat(fd), os.stat(path)):
+                    return fd
+            except OSError:
+                pass
+            # renamed or removed by its previous holder before we locked it
+            os.close(fd)
+
+    def lock(self):
+        """ Lock the partial file for this process, switching to one of its
+        own if another process is downloading to the shared one """
+        if self._fd is not None:
+            return
+        self._fd = self._lock(self.part_path)
+        if self._fd is None:
+            self.part_path = '%s.%d.part' % (self.path, os.getpid())
+            self._fd = self._lock(self.part_path)
+            os.ftruncate(self._fd, 0)
+            self._remove(self.validator_path)
+
+    def release(self):
+        """ Unlock the partial file, removing it if it is this process's own
+        or nothing was downloaded to it """
+        if self._fd is None:
+            return
+        if not self.shared or not self.offset:
+            self._remove(self.part_path)
+            self._remove(self.validator_path)
+        os.close(self._fd)
+        self._fd = None
+
+    @property
+    def offset(self):
+        """ The number of bytes downloaded so far """
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    @property
+    def validator(self):
+        try:
+            with open(self.validator_path, 'r') as f:
+                return f.read().strip() or None
+        except IOError:
+            return None
+
+    def resume_headers(self):
+        """
+        :return: The headers asking for the rest of the file, if it has not
+            changed since the part already downloaded, or an empty dictionary
+            if there is nothing to resume.
+        """
+        validator = self.validator
+        if not (self.offset and validator):
+            return {}
+        return {'Range': 'bytes=%d-' % self.offset, 'If-Range': validator}
+
+    def accepts(self, response):
+        """ Whether the response carries the whole file, or the rest of the
+        partial file, rather than an error """
+        return response.status_code == 200 or self._resumes(response)
+
+    def _resumes(self, response):
+        """ Whether the response carries the rest of the partial file """
+        content_range = response.headers.get('content-range') or ''
+        return response.status_code == 206 and \
+            content_range.startswith('bytes %d-' % self.offset)
+
+    def _save_validator(self, response):
+        etag = response.headers.get('etag')
+        if etag and not etag.startswith('W/'): # weak etags cannot be used in If-Range
+            validator = etag
+        else:
+            validator = response.headers.get('last-modified')
+
+        if validator:
+            with open(self.validator_path, 'w') as f:
+                f.write(validator)
+        elif os.path.exists(self.validator_path):
+            os.unlink(self.validator_path)
+
+    def open(self, response, checker, chunk_size=64 * 1024):
+        """
+        :param response: The response to a request made with the headers
+            from `resume_headers`.
+        :param checker: An object with an ``update`` method which is given
+            the bytes already downloaded if the response resumes them, so
+            that it sees the whole file.
+        :return: A file object to write the body of the response to, after
+            any part of the file already downloaded.
+        """
+        if self._resumes(response):
+            with open(self.part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    checker.update(chunk)
+            return open(self.part_path, 'ab')
+
+        self._save_validator(response)
+        return open(self.part_path, 'wb')
+
+    def complete(self):
+        """ Move the downloaded file to its final path """
+        os.rename(self.part_path, self.path)
+        self._remove(self.validator_path)
+        self.release()
+
+    def restart(self):
+        """ Forget everything downloaded so far, keeping the partial file and
+        any lock on it """
+        with open(self.part_path, 'wb'):
+            pass
+        self._remove(self.validator_path)
+
+    def discard(self):
+        """ Remove everything downloaded so far """
+        self._remove(self.part_path)
+        self._remove(self.validator_path)
+        self.release()
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def __repr__(self):
+        return '<PartialFile: %s>' % self.part_path
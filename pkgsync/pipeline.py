@@ -0,0 +1,125 @@
+import sys
+import threading
+from Queue import Queue
+
+_DONE = object()
+
+class _Job(object):
+
+    def __init__(self, item):
+        self.item = item
+        self.error = None
+
+class Pipeline(object):
+    """ Pass items through a series of stages, each stage running in its own
+    thread and connected to the next by a bounded queue, so that while one
+    item is in a later stage the following item can already be in an earlier
+    one::
+
+        pipeline = Pipeline([fetch, register, upload])
+        for item, error in pipeline.run(items):
+            ...
+
+    A stage may be given as a ``(callable, threads)`` tuple to have several
+    threads take items from the previous stage at once, which suits stages
+    that mostly wait on the network. Items leave the pipeline in the order
+    they were given unless a stage has more than one thread.
+    """
+
+    def __init__(self, stages, maxsize=1, expected=()):
+        """
+        :param stages: A list of callables, each of which is called with an
+            item once the previous stage has finished with it, or of
+            ``(callable, threads)`` tuples.
+        :param maxsize: The number of items that may wait between two stages.
+        :param expected: A tuple of exception classes which, when raised by a
+            stage, fail only the item being processed. The item skips the
+            remaining stages and is yielded with the exception. Any other
+            exception stops the pipeline and is re-raised by `run`.
+        """
+        self.stages = stages
+        self.maxsize = maxsize
+        self.expected = expected
+
+        self._abort = threading.Event()
+        self._exc_info = None
+        self._lock = threading.Lock()
+
+    def _feed(self, items, outbox):
+        for item in items:
+            if self._abort.is_set():
+                break
+            outbox.put(_Job(item))
+        outbox.put(_DONE)
+
+    def _work(self, stage, inbox, outbox, running):
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                with self._lock:
+                    running[0] -= 1
+                    last = not running[0]
+                if last:
+                    outbox.put(_DONE)
+                else:
+                    inbox.put(_DONE) # for the stage's other threads
+                return
+            if self._abort.is_set():
+                continue # drain the queue so upstream stages can finish
+            if job.error is None:
+                try:
+                    stage(job.item)
+                except self.expected, e:
+                    job.error = e
+                except Exception:
+                    with self._lock:
+                        self._exc_info = self._exc_info or sys.exc_info()
+                    self._abort.set()
+                    continue
+            outbox.put(job)
+
+    def _start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def run(self, items):
+        """
+        :param items: An iterable of items to pass through every stage.
+        :return: yields an ``(item, error)`` tuple for each item as it leaves
+            the final stage, where error is None if every stage succeeded.
+        """
+        self._abort.clear()
+        self._exc_info = None
+
+        queues = [Queue(self.maxsize) for i in range(len(self.stages) + 1)]
+        threads = [self._start(self._feed, items, queues[0])]
+        for i, stage in enumerate(self.stages):
+            if isinstance(stage, tuple):
+                stage, count = stage
+            else:
+                count = 1
+            running = [count]
+            for n in range(count):
+                threads.append(self._start(self._work, stage, queues[i], queues[i + 1], running))
+
+        job = None
+        try:
+            while True:
+                job = queues[-1].get()
+                if job is _DONE:
+                    break
+                yield job.item, job.error
+        finally:
+            if job is not _DONE: # the caller gave up early
+                self._abort.set()
+                while queues[-1].get() is not _DONE:
+                    pass
+
+        for thread in threads:
+            thread.join()
+
+        if self._exc_info:
+            exc_type, exc_value, traceback = self._exc_info
+            raise exc_type, exc_value, traceback
@@ -0,0 +1,87 @@
+import json
+
+class Plan(list):
+    """ The distributions a `Sync` would synchronise, worked out without
+    downloading any of them. Each entry is a dictionary describing one
+    distribution on the source repository::
+
+        {
+            "spec": "pkgsync>=0.1",
+            "package": "pkgsync",
+            "version": "0.1.0",
+            "basename": "pkgsync-0.1.0.tar.gz",
+            "url": "https://pypi.python.org/packages/.../pkgsync-0.1.0.tar.gz#md5=...",
+            "size": 11423,
+            "hashes": {"sha256": "..."},
+            "destinations": ["https://eggsample.com"],
+            "register": ["https://eggsample.com"],
+            "metadata": {"sha256": "..."}
+        }
+
+    A plan can be written out with `Plan.dump` and read back in with
+    `Plan.from_fp` so that it can be executed by a later `Sync.execute`.
+    """
+
+    @classmethod
+    def from_fp(cls, fp):
+        """
+        :param fp: A file-like object containing a plan written by `Plan.dump`
+        :returns: An instantiated `Plan` object.
+        """
+        return cls(json.load(fp)['distributions'])
+
+    @staticmethod
+    def entry(spec, dist_link, size=None, destinations=None, register=None, metadata=None, hashes=None):
+        """
+        :param spec: The release specification the distribution was found for.
+        :param dist_link: A `RemoteDistribution` on the source repository.
+        :param size: The size of the distribution in bytes, if known.
+        :param destinations: The urls of the destination repositories the
+            distribution is missing from. If omitted, it is synchronised to
+            every destination.
+        :param register: The urls of those destinations on which the
+            distribution's release needs registering. If omitted, it is
+            registered on every destination it is synchronised to.
+        :param metadata: The digests of the distribution's PEP 658 metadata
+            file, if the source publishes one.
+        :param hashes: The digests of the distribution listed apart from its
+            url, as in the JSON simple API, so that it can be verified when it
+            is downloaded.
+        """
+        entry = {
+            'spec': spec,
+            'package': dist_link.package_name,
+            'version': dist_link.version,
+            'basename': dist_link.basename,
+            'url': dist_link.url,
+            'size': size,
+        }
+        if destinations is not None:
+            entry['destinations'] = destinations
+        if register is not None:
+            entry['register'] = register
+        if metadata is not None:
+            entry['metadata'] = metadata
+        if hashes:
+            entry['hashes'] = hashes
+        return entry
+
+    def packages(self):
+        """ Yield the entries for each package in the plan, in order """
+        grouped = {}
+        order = []
+        for entry in self:
+            if not entry['package'] in grouped:
+                grouped[entry['package']] = []
+                order.append(entry['package'])
+            grouped[entry['package']].append(entry)
+        for package in order:
+            yield grouped[package]
+
+    @property
+    def size(self):
+        """ The total size in bytes of every distribution of known size """
+        return sum(entry['size'] or 0 for entry in self)
+
+    def dump(self, fp):
+        json.dump({'distributions': list(self)}, fp, indent=2, sort_keys=True)
@@ -1,60 +1,114 @@
-import re
 import os
+import pkg_resources
 import urllib
 import urlparse
-from .exceptions import InvalidRemoteDistribution
+import requests
+from .exceptions import InvalidRemoteDistribution, MetadataUnavailable, DownloadFailed
 from .dist import Distribution
-from .digest import IteratingMd5Checker
+from .digest import StreamingDigestChecker, DigestMismatchException, parse_fragment
+from .partial import PartialFile
+from . import filename
+
+def path_basename(path):
+    """ :return: The unquoted filename at the end of a distribution's path """
+    defragged = urlparse.urldefrag(path)[0]
+    return urllib.unquote(defragged.split('/')[-1])
+
+def path_hashes(path):
+    """ :return: The hex digest in the fragment of a distribution's path, such
+    as ``#sha256=...``, keyed by hash name, if the fragment names a hash """
+    return parse_fragment(urlparse.urldefrag(path)[1])
+
+def known_digests(path, hashes=None):
+    """ :return: Every hex digest known for a distribution, from its path's
+    fragment and the hashes listed for it, keyed by hash name """
+    digests = path_hashes(path)
+    digests.update(hashes or {})
+    return digests
+
+def same_content(a, b):
+    """
+    :param a: A `RemoteDistribution` or `ListedDistribution`.
+    :param b: Another, normally of the same basename.
+    :return: False if the two distributions have a digest of the same kind
+        which differs, otherwise True.
+    """
+    mine, theirs = a.digests, b.digests
+    for name in set(mine) & set(theirs):
+        if mine[name] != theirs[name]:
+            return False
+    return True
+
+#: The hashes a downloaded distribution is added to a cache under, in the
+#: order the cache is searched
+CACHE_ALGORITHMS = ('sha256', 'md5')
 
 class RemoteDistribution(object):
     """A distribution on a remote repository"""
 
-    def __init__(self, repository, path, package_name):
+    def __init__(self, repository, path, package_name, hashes=None, size=None, metadata=None):
         """
         :param repository: A `Repository` object
         :param path: The path to the distribution on the repository, relative
             to `Repository.package_index` for this package_name
         :param package_name: The name of the package that this distribution is
             for
+        :param hashes: A dictionary of hex digests of the distribution keyed
+            by hash name, if the repository lists them separately from the
+            path, as in the JSON simple API.
+        :param size: The size of the distribution in bytes, if known.
+        :param metadata: If the repository publishes the distribution's
+            metadata in a file of its own (PEP 658), a dictionary of the hex
+            digests of that file keyed by hash name, which may be empty.
         """
         self.repository = repository
         self.path = path
         self.package_name = package_name
+        self.hashes = hashes or {}
+        self.size = size
+        self.metadata = metadata
         self.parse_path()
 
     def _parse_distribution_name(self):
-        if self.basename.endswith('.egg'):
-            parser = re.compile(r'^(?P<package_name>%s)-' \
-                '(?P<version>.*)(-)' \
-                '(?P<pyversion>py[\d\.]+)' \
-                '(?P<extension>\.egg)$' % (self.package_name,)
-            )
-        else:
-            parser = re.compile(r'^(?P<package_name>%s)-' \
-                '(?P<version>.*)' \
-                '(?P<extension>\.zip|\.tgz|\.tar\.gz|\.tar\.bz2)$' % (
-                self.package_name,)
-            )
-        r = parser.search(self.basename)
-        if r:
-            return r.groupdict()
-
-    def _parse_digest(self):
-        return urllib.splitvalue(urlparse.urldefrag(self.path)[1])[1]
+        return filename.parser.parse(self.basename, self.package_name)
 
     def _parse_basename(self):
-        defragged = urlparse.urldefrag(self.path)[0]
-        return urllib.unquote(defragged.split('/')[-1])
+        return path_basename(self.path)
+
+    def _fetch(self, partial, chunk_size):
+        """
+        Download the distribution, or the rest of it if it was partially
+        downloaded before, to ``partial``.
 
-    def _save_data(self, what, where, md5_check=None):
-        f = open(where, 'wb')
-        f.write(what)
-        f.close()
+        :return: A `StreamingDigestChecker` which has seen the whole file.
+        :raises DownloadFailed: If the repository answers with an error
+            rather than the file.
+        """
+        headers = partial.resume_headers()
+        if headers:
+            response = self.repository.get(self.url, stream=True, headers=headers)
+            if response.status_code in (206, 416) and not partial.accepts(response):
+                # the partial file cannot be resumed, for instance because it
+                # is already complete, so start again
+                response.close()
+                partial.restart()
+                response = self.repository.get(self.url, stream=True)
+        else:
+            response = self.repository.get(self.url, stream=True)
 
-        if md5_check:
-            IteratingMd5Checker(where, md5_check).check()
+        if not partial.accepts(response):
+            response.close()
+            raise DownloadFailed(self.basename, response.status_code)
 
-        return where
+        checker = StreamingDigestChecker(partial.path, self.digests)
+        try:
+            with partial.open(response, checker, chunk_size) as f:
+                for chunk in response.iter_content(chunk_size):
+                    checker.update(chunk)
+                    f.write(chunk)
+        finally:
+            response.close()
+        return checker
 
     def parse_path(self):
         self.basename = self._parse_basename()
@@ -64,7 +118,9 @@ class RemoteDistribution(object):
         self.version = parsed_name.get('version')
         self.pyversion = parsed_name.get('pyversion')
         self.extension = parsed_name.get('extension')
-        self.md5_digest = self._parse_digest()
+        self.abi = parsed_name.get('abi')
+        self.platform = parsed_name.get('platform')
+        self.md5_digest = self.digests.get('md5')
 
     @property
     def url(self):
@@ -73,12 +129,94 @@ class RemoteDistribution(object):
             self.path,
         )
 
-    def download(self, save_to='/tmp'):
-        response = self.repository.get(self.url)
-        file_path = os.path.join(save_to, self.basename)
-        return Distribution(
-            self._save_data(response.content, file_path, md5_check=self.md5_digest)
-        )
+    @property
+    def metadata_url(self):
+        """ The url of the distribution's PEP 658 metadata file """
+        return urlparse.urldefrag(self.url)[0] + '.metadata'
+
+    def fetch_metadata(self):
+        """
+        Fetch only the distribution's metadata, from the file the repository
+        publishes alongside it, checking any digests listed for the file.
+
+        :raises MetadataUnavailable: If the repository publishes no metadata
+            file for the distribution.
+        :return: The contents of the metadata file, as found in the
+            distribution's PKG-INFO or METADATA.
+        """
+        if self.metadata is None:
+            raise MetadataUnavailable(self.basename)
+        response = self.repository.get(self.metadata_url)
+        if response.status_code != 200:
+            raise MetadataUnavailable(self.basename)
+        checker = StreamingDigestChecker(self.metadata_url, self.metadata, algorithms=())
+        checker.update(response.content)
+        checker.check()
+        return response.content
+
+    def content_length(self):
+        """
+        :return: The size in bytes of the distribution as listed by the
+            repository, or else as reported in response to a HEAD request, or
+            None if it is not reported.
+        """
+        if self.size is not None:
+            return self.size
+        response = self.repository.head(self.url)
+        try:
+            return int(response.headers['content-length'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def download(self, save_to='/tmp', chunk_size=64 * 1024, retries=2, cache=None, metadata_cache=None):
+        """
+        Stream the distribution to a file, checking every digest listed for it
+        as it arrives, and calculating its md5 and sha256 digests.
+        If the download is interrupted what has been downloaded is kept, and
+        the rest asked for with a Range request when it is tried again, either
+        within this call or by a later one.
+
+        :param save_to: The directory the file is saved in.
+        :param chunk_size: The number of bytes held in memory at a time.
+        :param retries: The number of times an interrupted download is resumed.
+        :param cache: A `DistributionCache` which is checked for the
+            distribution before downloading it, and which it is added to once
+            downloaded.
+        :param metadata_cache: A `MetadataCache` passed on to the
+            `Distribution`.
+        :return: A `Distribution` for the downloaded file.
+        """
+        partial = PartialFile(os.path.join(save_to, self.basename))
+
+        digests = self.digests
+        if cache:
+            for name in CACHE_ALGORITHMS:
+                if digests.get(name) and cache.get(name, digests[name], partial.path):
+                    return Distribution(partial.path, digests=digests, metadata_cache=metadata_cache)
+
+        partial.lock()
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    checker = self._fetch(partial, chunk_size)
+                    break
+                except requests.RequestException:
+                    if attempt == retries:
+                        raise
+
+            try:
+                checker.check()
+            except DigestMismatchException:
+                partial.discard()
+                raise
+            partial.complete()
+        finally:
+            partial.release()
+        digests = checker.hexdigests()
+        if cache:
+            for name in CACHE_ALGORITHMS:
+                cache.store(name, digests[name], partial.path)
+        return Distribution(partial.path, digests=digests, metadata_cache=metadata_cache)
 
     def __repr__(self):
         attrs = ['repository', 'path', 'md5_digest', 'version', 'basename']
@@ -89,12 +227,63 @@ class RemoteDistribution(object):
             r += '%s=%r, ' % (attr, getattr(self, attr))
         return r.rstrip(', ') + ')'
 
+    @property
+    def digests(self):
+        """ Every hex digest known for this distribution, from its listing or
+        its url's fragment, keyed by hash name """
+        return known_digests(self.path, self.hashes)
+
+    def same_content(self, other):
+        """ As `same_content`, for this distribution and another """
+        return same_content(self, other)
+
     @staticmethod
-    def diff(a, b):
+    def diff(a, b, compare_digests=False):
         """
         :param a: a list or tuple of RemoteDistribution objects
         :param b: another list/tuple of RemoteDistribution objects
+        :param compare_digests: Also treat a distribution in b as missing if
+            it has the same basename as one in a but a different digest.
         :return: a list of RemoteDistribution objects required to make b match a
         """
-        b_basenames = [d.basename for d in b]
-        return [d for d in a if not d.basename in b_basenames]
+        b_by_basename = dict((d.basename, d) for d in b)
+        if not compare_digests:
+            return [d for d in a if not d.basename in b_by_basename]
+        return [
+            d for d in a
+            if not d.basename in b_by_basename
+            or not d.same_content(b_by_basename[d.basename])
+        ]
+
+    @staticmethod
+    def select(distributions, spec, exclude=[], latest=False):
+        """
+        :param distributions: An iterable of RemoteDistribution objects, such
+            as those returned by `Repository.all_distributions`.
+        :param spec: A specification string describing one or more package
+            releases, such as "pkgsync>0.1.0,<0.3.0" or "pkgsync==0.1.0".
+        :param exclude: One or more specification strings describing
+            releases all with the same package name, which should not be
+            returned.
+        :param latest: Only yield the distribution with the highest version.
+        :return: yields the RemoteDistribution objects matching the given
+            release specification.
+        """
+        parsed_spec = pkg_resources.Requirement.parse(spec)
+
+        if latest:
+            try:
+                yield max(distributions, key=lambda d: pkg_resources.parse_version(d.version))
+            except ValueError: # there are no dists
+                pass
+            raise StopIteration()
+
+        for remote_dist in distributions:
+            if remote_dist.version in parsed_spec:
+                if exclude:
+                    for ex_spec in exclude:
+                        parsed_ex = pkg_resources.Requirement.parse(ex_spec)
+                        if not remote_dist.version in parsed_ex:
+                            yield remote_dist
+                else:
+                    yield remote_dist
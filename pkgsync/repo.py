@@ -1,23 +1,58 @@
+import json
+import urllib
 import urllib2
+import urlparse
+import xmlrpclib
 import pkg_resources
-from xml.dom.minidom import parseString
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .exceptions import InvalidRemoteDistribution
 from .remote import RemoteDistribution
+from .listing import Listing
 from .upload import Uploader
+from .cache import IndexCache
+from .links import iter_links
+from .digest import parse_fragment
 from .versions import Versions
 
 class Repository(object):
 
-    def __init__(self, uri, username=None, password=None, simple_prefix='simple', uploader=Uploader):
+    JSON_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+    ACCEPT = ', '.join([
+        JSON_CONTENT_TYPE,
+        'application/vnd.pypi.simple.v1+html;q=0.2',
+        'text/html;q=0.01',
+    ])
+
+    #: The link attributes and JSON keys which say that a distribution's
+    #: metadata is published in a file of its own, as per PEP 658 and the
+    #: later names PEP 714 gave them
+    METADATA_ATTRIBUTES = ('data-core-metadata', 'data-dist-info-metadata')
+    METADATA_KEYS = ('core-metadata', 'dist-info-metadata')
+
+    def __init__(self, uri, username=None, password=None, simple_prefix='simple', xmlrpc_prefix='pypi', uploader=Uploader, pool_size=10, timeout=(10, 60), index_cache=None, prefer_json=True):
         """
         :param uri: Repository URL. Lolz.
         :param username: Username for http authentication
         :param password: Password for http authentication
         :param simple_prefix: The path under which packages are listed.
+        :param xmlrpc_prefix: The path of the repository's XML-RPC interface,
+            used to ask for the changelog.
         :param uploader: `Uploader` or a class that implements its public methods.
+        :param pool_size: The number of connections kept open to each host, for
+            reuse by later requests. Should be at least the number of threads
+            making requests at once.
+        :param timeout: Seconds to wait for a connection and then for a
+            response, as either a single number or a ``(connect, read)``
+            tuple. None waits forever.
+        :param index_cache: An `IndexCache` that the links on index pages are
+            kept in, so that unchanged pages are not downloaded or parsed
+            again.
+        :param prefer_json: Ask for the JSON form of the simple API (PEP 691)
+            of index pages, falling back to html if the repository does not
+            provide it.
         """
         self.username = username
         self.password = password
@@ -26,21 +61,40 @@ class Repository(object):
 
         self.uri = uri
         self.simple_prefix = 'simple'
+        self.xmlrpc_prefix = xmlrpc_prefix
 
         self.uploader = uploader(self)
 
+        self.timeout = timeout
+        self.index_cache = index_cache
+        self.prefer_json = prefer_json
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
         self._package_names = []
 
-    def get(self, url, **kwargs):
-        if self.authentication:
-            kwargs.setdefault('auth', self._auth)
-        response = requests.get(url, **kwargs)
+    def _check(self, response, url):
         if response.status_code == 401:
             raise RuntimeError('Incorrect username/password for %s' % url)
         if response.status_code == 403:
             raise RuntimeError('You do not have permission to access %s' % url)
         return response
 
+    def get(self, url, **kwargs):
+        if self.authentication:
+            kwargs.setdefault('auth', self._auth)
+        kwargs.setdefault('timeout', self.timeout)
+        return self._check(self.session.get(url, **kwargs), url)
+
+    def head(self, url, **kwargs):
+        if self.authentication:
+            kwargs.setdefault('auth', self._auth)
+        kwargs.setdefault('allow_redirects', True)
+        kwargs.setdefault('timeout', self.timeout)
+        return self._check(self.session.head(url, **kwargs), url)
+
     @property
     def _auth(self):
         return (self.username, self.password)
@@ -51,6 +105,98 @@ class Repository(object):
             self.simple_prefix,
         )
 
+    def _is_json(self, response):
+        content_type = response.headers.get('content-type') or ''
+        return content_type.split(';')[0].strip() == self.JSON_CONTENT_TYPE
+
+    def _metadata(self, value):
+        """
+        :param value: The value of a link's PEP 658 metadata attribute, or of
+            a file's metadata key in the JSON simple API.
+        :return: None if no metadata file is published for the distribution,
+            otherwise a dictionary of its digests, which may be empty.
+        """
+        if value is True:
+            return {}
+        if isinstance(value, dict):
+            return dict((name.lower(), digest) for name, digest in value.items())
+        if isinstance(value, basestring) and value.lower() != 'false':
+            return parse_fragment(value)
+        return None
+
+    def _with_metadata(self, link, values):
+        """ Add the digests of the link's metadata file to it, from the first
+        of the given attribute values, if the file is published """
+        metadata = self._metadata(values[0]) if values else None
+        if metadata is not None:
+            link['metadata'] = metadata
+        return link
+
+    def _json_links(self, response):
+        """ Links from a PEP 691 JSON index page, either the list of projects
+        or the files for a single project """
+        page = json.loads(response.content)
+        for project in page.get('projects', []):
+            yield {'href': project['name'] + '/', 'text': project['name']}
+        for f in page.get('files', []):
+            link = {
+                'href': f['url'],
+                'text': f['filename'],
+                'hashes': f.get('hashes') or {},
+                'size': f.get('size'),
+            }
+            yield self._with_metadata(link, [f[key] for key in self.METADATA_KEYS if key in f])
+
+    def _html_links(self, response, chunk_size):
+        links = iter_links(response.iter_content(chunk_size), attributes=self.METADATA_ATTRIBUTES)
+        for href, text, attrs in links:
+            link = {'href': href, 'text': text}
+            yield self._with_metadata(link, [attrs[name] for name in self.METADATA_ATTRIBUTES if name in attrs])
+
+    def links(self, url, chunk_size=64 * 1024):
+        """
+        :param url: The url of an index page on this repository.
+        :param chunk_size: The number of bytes read from an html page at a time.
+        :return: yields a dictionary for each link on the page, with the
+            ``href`` and ``text`` of the link, for pages in the JSON form
+            of the simple API the file's ``hashes`` and ``size``, and the
+            digests of its PEP 658 ``metadata`` file if one is published. Nothing is
+            yielded if there is no such page. Links on html pages are yielded
+            as the page downloads. If the page is in the index cache and has
+            not changed, the cached links are yielded instead.
+        """
+        entry = self.index_cache and self.index_cache.get(url)
+        headers = IndexCache.conditional_headers(entry)
+        if self.prefer_json:
+            headers['Accept'] = self.ACCEPT
+        if headers:
+            response = self.get(url, stream=True, headers=headers)
+        else:
+            response = self.get(url, stream=True)
+
+        try:
+            if response.status_code == 404:
+                return
+            if entry and response.status_code == 304:
+                for link in entry['links']:
+                    yield link
+                return
+
+            if self._is_json(response):
+                found = self._json_links(response)
+            else:
+                found = self._html_links(response, chunk_size)
+
+            links = []
+            for link in found:
+                if self.index_cache:
+                    links.append(link)
+                yield link
+            if self.index_cache:
+                self.index_cache.store(url, response, links)
+        finally:
+            response.close()
+
     def package_index(self, package_name):
         """
         :param package_name: The package name string.
@@ -65,24 +211,27 @@ class Repository(object):
     def all_distributions(self, package_name):
         """
         :param package_name: The name of a package.
-        :returns: A `RemoteDistribution` object for every distribution
-            available for the given package name.
+        :returns: A `Listing` of every distribution available for the given
+            package name. Each behaves as a `RemoteDistribution`, which is
+            only created for it when more than its version, digests or
+            basename are needed.
 
         :note: To restrict the `RemoteDistribution` objects to a particular
             release specification, such as ``pkgsync>0.1``, use the
             `Repository.distributions` method.
         """
-        request = self.get(self.package_index(package_name))
-        if request.status_code == 404:
-            raise StopIteration()
-
-        dom = parseString(request.content)
-        for link in dom.getElementsByTagName('a'):
+        listing = Listing(self, package_name)
+        for link in self.links(self.package_index(package_name)):
+            if not link['href']:
+                continue
             try:
-                path = link.attributes['href'].value
-                yield RemoteDistribution(self, path, package_name)
+                listing.add(
+                    link['href'], hashes=link.get('hashes'), size=link.get('size'),
+                    metadata=link.get('metadata'),
+                )
             except InvalidRemoteDistribution:
                 continue # ignore the link and move on
+        return listing
 
     def distributions(self, spec, exclude=[], latest=False):
         """
@@ -94,36 +243,49 @@ class Repository(object):
         :return: yields `RemoteDistribution` objects for each distribution
             matching the given release specification.
         """
-        parsed_spec = pkg_resources.Requirement.parse(spec)
-        package_name = parsed_spec.project_name
-
-        all_dists = self.all_distributions(package_name)
-
-        if latest:
-            try:
-                yield max(all_dists, key=lambda d: pkg_resources.parse_version(d.version))
-            except ValueError: # there are no dists
-                pass
-            raise StopIteration()
-
-        for remote_dist in all_dists:
-            if remote_dist.version in parsed_spec:
-                if exclude:
-                    for ex_spec in exclude:
-                        parsed_ex = pkg_resources.Requirement.parse(ex_spec)
-                        if not remote_dist.version in parsed_ex:
-                            yield remote_dist
-                else:
-                    yield remote_dist
+        package_name = pkg_resources.Requirement.parse(spec).project_name
+        return RemoteDistribution.select(
+            self.all_distributions(package_name), spec,
+            exclude=exclude, latest=latest,
+        )
 
     def packages(self):
         """ :return: A list of the name of every package in this repo """
         if not self._package_names:
-            response = self.get(self._simple_url())
-            dom = parseString(response.content)
-            self._package_names = [e.firstChild.data for e in dom.getElementsByTagName('a')]
+            self._package_names = [link['text'] for link in self.links(self._simple_url())]
         return self._package_names
 
+    def _xmlrpc_url(self):
+        url = '%s/%s' % (self.uri.rstrip('/'), self.xmlrpc_prefix)
+        if self.authentication:
+            parts = urlparse.urlsplit(url)
+            url = urlparse.urlunsplit(parts._replace(
+                netloc='%s:%s@%s' % (
+                    urllib.quote(self.username, safe=''),
+                    urllib.quote(self.password, safe=''),
+                    parts.netloc,
+                )
+            ))
+        return url
+
+    def xmlrpc(self):
+        """ :return: An `xmlrpclib.ServerProxy` for this repository """
+        return xmlrpclib.ServerProxy(self._xmlrpc_url())
+
+    def last_serial(self):
+        """ :return: The serial of the most recent change to this repository """
+        return self.xmlrpc().changelog_last_serial()
+
+    def changelog(self, since_serial):
+        """
+        :param since_serial: A serial previously returned by `last_serial` or
+            found in the changelog.
+        :return: A list of ``(name, version, timestamp, action, serial)``
+            tuples for every change made to this repository after the given
+            serial, as per PyPI's ``changelog_since_serial``.
+        """
+        return self.xmlrpc().changelog_since_serial(since_serial)
+
     def register(self, distribution):
         """ Register the given distribution to this package repository
 
@@ -138,8 +300,12 @@ class Repository(object):
         """ Upload the given distribution to this package repository
 
         :param distribution: A `Distribution` object
+        :return: A tuple of the response's status and content, the status
+            being None if no response was received.
         """
         response = self.uploader.upload(distribution)
+        if response is None:
+            return None, ''
         if response.status == 401:
             raise RuntimeError('Incorrect username/password for %s' % self.upload_url)
         return response.status, response.read()
@@ -40,3 +40,30 @@ class StatusReporter(object):
             self.inline(message, stream=sys.stderr)
         else:
             self.report(message, stream=sys.stderr)
+
+
+class BufferedReporter(object):
+    """ Records report, inline and error calls so that they can be replayed in
+    one go against another reporter. Used to keep the output for a single
+    package together when several packages are synchronised at once. """
+
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+
+    def report(self, *args, **kwargs):
+        self.calls.append(('report', args, kwargs))
+
+    def inline(self, *args, **kwargs):
+        self.calls.append(('inline', args, kwargs))
+
+    def error(self, *args, **kwargs):
+        self.calls.append(('error', args, kwargs))
+
+    def replay(self, ui):
+        """
+        :param ui: The reporter that every recorded call is made against, in
+            the order the calls were originally made.
+        """
+        for name, args, kwargs in self.calls:
+            getattr(ui, name)(*args, **kwargs)
+        self.calls = []
@@ -1,19 +1,54 @@
 import os
 import sys
+import threading
 import collections
 import pkg_resources
-from .dist import Distribution
+from multiprocessing.pool import ThreadPool
+from .dist import Distribution, MetadataDistribution
 from .upload import Uploader
-from .exceptions import InvalidDistribution
-from .status import NothingReporter
+from .exceptions import InvalidDistribution, MetadataUnavailable, DownloadFailed, UploadFailed
+from .digest import DigestMismatchException
+from .status import NothingReporter, BufferedReporter
 from .remote import RemoteDistribution
+from .pipeline import Pipeline
+from .journal import NothingJournal
+from .plan import Plan
+
+class Transfer(object):
+    """ A single distribution on its way from the source to the destination """
+
+    def __init__(self, dist_link, ui, destinations, register_to=None):
+        """
+        :param dist_link: The `RemoteDistribution` on the source repository.
+        :param ui: The reporter that progress for this distribution goes to.
+        :param destinations: The destination repositories that lack the
+            distribution.
+        :param register_to: Those of the destinations on which the
+            distribution's release is not yet registered, defaulting to all.
+        """
+        self.dist_link = dist_link
+        self.ui = ui
+        self.destinations = destinations
+        self.register_to = destinations if register_to is None else register_to
+        self.distribution = None
+
+class PackageJob(object):
+    """ The specs for a package, and its listings once they are fetched """
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.listings = None
+        self.result = None
 
 class Sync(object):
 
-    def __init__(self, source, destination, exclude, include, tmp_dir='/tmp', ui=NothingReporter()):
+    def __init__(self, source, destination, exclude, include, tmp_dir='/tmp', ui=NothingReporter(), workers=1, pipeline_depth=1, journal=NothingJournal(), index_concurrency=0, compare_digests=False, download_cache=None, metadata_cache=None, register_only=False):
         """
         :param source: The Repository packages will be downloaded from
-        :param destination: The Repository packages will be uploaded to
+        :param destination: The Repository packages will be uploaded to, or a
+            list of them. Each distribution is downloaded once, however many
+            of the destinations it is missing from, and uploaded to those
+            destinations at the same time.
         :param exclude:
             A Versions object describing which packages should not be
             synchronised between the source and destination repositories.
@@ -26,66 +61,551 @@ class Sync(object):
         :param ui:
             A StatusReporter class, defaulting to pkgsync.status.NothingReporter
             for which each output method is a no-op.
+        :param workers:
+            The number of packages to synchronise at the same time. The
+            default of 1 synchronises each package in turn.
+        :param pipeline_depth:
+            The number of distributions that may wait between one step of
+            synchronising a package (download, register, upload) and the next.
+        :param journal:
+            A `Journal` in which completed packages and uploads are recorded,
+            and whose entries are skipped. Defaults to
+            pkgsync.journal.NothingJournal, which records nothing.
+        :param index_concurrency:
+            The number of packages whose index pages are fetched at once,
+            ahead of synchronising them. Since fetching index pages is mostly
+            waiting on the network, this can be far higher than ``workers``.
+            The default of 0 fetches each package's index pages in the worker
+            synchronising it.
+        :param compare_digests:
+            Synchronise distributions which are on the destination repository
+            but whose digest there differs from the one on the source.
+        :param download_cache:
+            A `DistributionCache` that distributions are taken from, rather
+            than downloaded, if they are there, and are added to otherwise.
+        :param metadata_cache:
+            A `MetadataCache` that the metadata of downloaded distributions is
+            taken from, by digest, rather than read from their archives.
+        :param register_only:
+            Only register the releases missing from the destination
+            repositories, from the metadata files the source publishes for
+            its distributions (PEP 658), without downloading or uploading any
+            distributions. Distributions without a metadata file are counted
+            as failed. A release is taken to be registered only once a
+            destination has one of its files, so releases registered this way
+            are registered again by each such run.
         """
         self.source = source
-        self.destination = destination
+        if isinstance(destination, (list, tuple)):
+            self.destinations = list(destination)
+        else:
+            self.destinations = [destination]
         self.exclude = exclude
         self.include = include
         self.tmp_dir = tmp_dir
         self.ui = ui
+        self.workers = workers
+        self.pipeline_depth = pipeline_depth
+        self.journal = journal
+        self.index_concurrency = index_concurrency
+        self.compare_digests = compare_digests
+        self.download_cache = download_cache
+        self.metadata_cache = metadata_cache
+        self.register_only = register_only
+
+        self._ui_lock = threading.Lock()
+        self.synced = []
+        self.failed = []
+
+    @property
+    def destination(self):
+        """ The first, or only, destination repository """
+        return self.destinations[0]
 
-    def _cleanup(self, path):
-        self.ui.inline('cleaning up...')
+    def _cleanup(self, path, ui=None):
+        ui = ui or self.ui
+        ui.inline('cleaning up...')
         try:
             os.unlink(path)
             return True
         except OSError, IOError:
             return False
 
-    def sync_distribution(self, dist_link):
-        self.ui.report('version %s:' % dist_link.version, level=1)
-        self.ui.inline('fetching...')
+    def _fetch(self, transfer):
+        transfer.ui.report('version %s:' % transfer.dist_link.version, level=1)
+        transfer.ui.inline('fetching...')
+        transfer.distribution = transfer.dist_link.download(
+            save_to=self.tmp_dir, cache=self.download_cache,
+            metadata_cache=self.metadata_cache,
+        )
+
+    def _fetch_metadata(self, transfer):
+        transfer.ui.report('version %s:' % transfer.dist_link.version, level=1)
+        transfer.ui.inline('fetching metadata...')
+        transfer.distribution = MetadataDistribution(
+            transfer.dist_link.basename, transfer.dist_link.fetch_metadata(),
+        )
+
+    def _each_destination(self, destinations, action):
+        """
+        Call ``action`` with each of the given destinations, in a thread per
+        destination if there is more than one.
+        """
+        if len(destinations) < 2:
+            for destination in destinations:
+                action(destination)
+            return
+        pool = ThreadPool(len(destinations))
+        try:
+            pool.map(action, destinations)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _to(self, destinations):
+        if len(destinations) > 1:
+            return ' to %d destinations' % len(destinations)
+        return ''
+
+    def _register(self, transfer):
+        """ Register the distribution's release where it is not already
+        registered, so that its metadata need not be parsed in full if
+        every destination has it """
+        if not transfer.register_to:
+            transfer.ui.inline('already registered...')
+            return
+        transfer.ui.inline('registering%s...' % self._to(transfer.register_to))
+        self._each_destination(
+            transfer.register_to, lambda d: d.register(transfer.distribution),
+        )
+
+    def _upload(self, transfer):
+        """ Upload the distribution to each destination, recording in the
+        journal those which accept it, and failing the distribution if any
+        do not """
+        transfer.ui.inline('uploading%s...' % self._to(transfer.destinations))
+        def upload(destination):
+            status, content = destination.upload(transfer.distribution)
+            if not (status and 200 <= status < 300):
+                raise UploadFailed(transfer.dist_link.basename, destination.uri, status)
+            self.journal.uploaded(transfer.dist_link.basename, destination.uri)
         try:
-            distribution = dist_link.download(save_to=self.tmp_dir)
-            self.ui.inline('registering...')
-            self.destination.register(distribution)
-            self.ui.inline('uploading...')
-            self.destination.upload(distribution)
-            cleaned = self._cleanup(distribution.path)
+            self._each_destination(transfer.destinations, upload)
+        finally:
+            cleaned = self._cleanup(transfer.distribution.path, ui=transfer.ui)
             if not cleaned:
-                self.ui.inline('cannot remove %s ' % downloaded_dist)
-        except InvalidDistribution, e:
-            self.ui.error('Cannot parse metadata from %s' % e.args[0])
+                transfer.ui.inline('cannot remove %s ' % transfer.distribution.path)
+
+    @property
+    def stages(self):
+        """ The steps taken, in order, to move a distribution to the destinations """
+        if self.register_only:
+            return [self._fetch_metadata, self._register]
+        return [self._fetch, self._register, self._upload]
+
+    #: The errors which fail only the distribution they are raised for
+    EXPECTED = (InvalidDistribution, DigestMismatchException)
+
+    def _error(self, error):
+        if isinstance(error, MetadataUnavailable):
+            return 'No metadata file for %s' % error.args[0]
+        if isinstance(error, UploadFailed):
+            return 'Cannot upload %s to %s, status %s' % error.args
+        if isinstance(error, DownloadFailed):
+            return 'Cannot download %s, status %s' % error.args
+        if isinstance(error, DigestMismatchException):
+            return 'Digest of %s does not match' % os.path.basename(error.args[0])
+        return 'Cannot parse metadata from %s' % error.args[0]
+
+    def sync_distribution(self, dist_link, ui=None, destinations=None):
+        """
+        Download, register and upload a single `RemoteDistribution`.
+
+        :param destinations: The destination repositories to upload the
+            distribution to, defaulting to all of them.
+        :return: True if the distribution was synchronised, False if it
+            could not be downloaded or verified, or its metadata parsed.
+        """
+        ui = ui or self.ui
+        transfer = Transfer(dist_link, ui, destinations or self.destinations)
+        try:
+            for stage in self.stages:
+                stage(transfer)
+        except self.EXPECTED, e:
+            ui.error(self._error(e))
+            return False
+        return True
+
+    def sync_distributions(self, dist_links, ui=None, destinations=None, register_to=None):
+        """
+        Download, register and upload each of the given `RemoteDistribution`
+        objects. Each step runs in its own thread so that the next distribution
+        is being downloaded while the previous one is registered and uploaded.
+
+        :param destinations: A list, parallel to ``dist_links``, of the
+            destination repositories each distribution is uploaded to. By
+            default each is uploaded to all of them.
+        :param register_to: A list, parallel to ``dist_links``, of those
+            destinations on which each distribution's release needs to be
+            registered. By default it is registered on all of them.
+        :return: A tuple of two lists, the basenames of the distributions that
+            were synchronised and of those that could not be.
+        """
+        ui = ui or self.ui
+        pipeline = Pipeline(
+            self.stages,
+            maxsize=self.pipeline_depth,
+            expected=self.EXPECTED,
+        )
+        destinations = destinations or [self.destinations] * len(dist_links)
+        register_to = register_to or [None] * len(dist_links)
+        transfers = [
+            Transfer(d, BufferedReporter(), to, register)
+            for d, to, register in zip(dist_links, destinations, register_to)
+        ]
+
+        synced, failed = [], []
+        for transfer, error in pipeline.run(transfers):
+            transfer.ui.replay(ui)
+            if error:
+                ui.error(self._error(error))
+                failed.append(transfer.dist_link.basename)
+            else:
+                synced.append(transfer.dist_link.basename)
+        return synced, failed
 
     def _package_name(self, spec):
         parsed = pkg_resources.Requirement.parse(spec)
         return parsed.project_name
 
-    def sync(self):
+    def listings(self, specs):
+        """
+        :param specs: One or more release specification strings, all for the
+            same package.
+        :return: A tuple of the list of every `RemoteDistribution` for the
+            package on the source repository, and a list of such lists, one
+            for each destination repository.
         """
-        Iterate alphabetically across each package in
-        self.include.distribution_links() and for each of the DistributionLink
-        objects generated synchronise the package to the self.destination
-        repository, if the file does not already exist there.
+        package_name = self._package_name(specs[0])
+        source_listing = list(self.source.all_distributions(package_name))
+        if not source_listing: # save making unnecessary requests to the destination repos
+            return [], [[] for d in self.destinations]
+        return source_listing, [
+            list(d.all_distributions(package_name)) for d in self.destinations
+        ]
+
+    def _required(self, specs, listings=None):
+        """
+        Fetch the source and destination listings for a package once, unless
+        they are given, and evaluate each of the given specs against them.
+
+        :return: A list of ``(spec, RemoteDistribution, destinations,
+            register_to)`` tuples, one for each distribution that is required,
+            with the first spec it matched, the destination repositories it is
+            missing from, and those of them which have no distribution of the
+            same version, and so need its release registered.
         """
-        for spec in sorted(self.include):
-            package_name = self._package_name(spec)
-            self.ui.report('Checking required versions for %s...' % package_name)
+        package_name = self._package_name(specs[0])
+        exclude = list(self.exclude.specs_for(package_name))
 
-            exclude = list(self.exclude.specs_for(package_name))
+        source_listing, destination_listings = listings or self.listings(specs)
 
-            source_distributions = self.source.distributions(spec, exclude=exclude)
-            if source_distributions:
-                destination_distributions = self.destination.distributions(spec, exclude=exclude)
-                to_sync = RemoteDistribution.diff(source_distributions, destination_distributions)
-            else: # save making an unnecessary request to the destination repo
-                to_sync = []
+        required = collections.OrderedDict()
+        for spec in specs:
+            source_distributions = list(
+                RemoteDistribution.select(source_listing, spec, exclude=exclude)
+            )
+            for destination, destination_listing in zip(self.destinations, destination_listings):
+                to_sync = RemoteDistribution.diff(
+                    source_distributions, destination_listing,
+                    compare_digests=self.compare_digests,
+                )
+                registered = set(d.version for d in destination_listing)
+                for d in to_sync:
+                    if self._has_uploaded(d.basename, destination):
+                        continue
+                    _, _, missing, unregistered = required.setdefault(d.basename, (spec, d, [], []))
+                    if destination not in missing:
+                        missing.append(destination)
+                        if not d.version in registered:
+                            unregistered.append(destination)
+        if self.register_only:
+            return self._unregistered_releases(required.values())
+        return required.values()
 
-            if not to_sync:
-                self.ui.inline('up to date.')
+    def _unregistered_releases(self, required):
+        """
+        :param required: A list of tuples as returned by `_required`.
+        :return: One such tuple for each release that needs registering on
+            a destination, for the first of its distributions with a metadata
+            file, and with both lists of destinations those on which the
+            release needs registering.
+
+        :note: Whether a release is registered is judged only from the files
+            listed on each destination, so a release which has been registered
+            but has no files is included again.
+        """
+        releases = collections.OrderedDict()
+        for spec, d, to, register in required:
+            if not register:
                 continue
+            if not d.version in releases:
+                releases[d.version] = [spec, d, []]
+            release = releases[d.version]
+            if release[1].metadata is None and d.metadata is not None:
+                release[1] = d
+            release[2].extend(r for r in register if not r in release[2])
+        return [(spec, d, register, register) for spec, d, register in releases.values()]
+
+    def required(self, specs, listings=None):
+        """
+        :param specs: One or more release specification strings, such as
+            ``pkgsync>0.1``, all for the same package.
+        :return: A list of the `RemoteDistribution` objects matching any of
+            the specifications which are on the source repository but not on
+            one or more of the destination repositories, and not yet recorded
+            in the journal.
+        """
+        return [required[1] for required in self._required(specs, listings)]
 
-            self.ui.inline('%s required' % ', '.join([v.version for v in to_sync]))
+    def _has_uploaded(self, basename, destination):
+        """ :return: True if the journal records the distribution as uploaded
+        to the destination, or, when there is only one destination, records it
+        without a destination as journals written by earlier versions do """
+        if self.journal.has_uploaded(basename, destination.uri):
+            return True
+        return len(self.destinations) == 1 and self.journal.has_uploaded(basename)
+
+    def _pending(self, specs, ui):
+        """ :return: those of the given specs not yet recorded in the journal """
+        pending = [spec for spec in specs if not self.journal.is_package_done(spec)]
+        if not pending:
+            ui.report('Skipping %s, already synchronised.' % ', '.join(specs))
+        return pending
+
+    def _done(self, specs, failed=()):
+        """ Record the specs as done, unless any of their distributions
+        failed, so that those are retried when the sync is resumed """
+        if failed:
+            return
+        for spec in specs:
+            self.journal.package_done(spec)
+
+    def sync_package(self, specs, ui=None, listings=None):
+        """
+        Synchronise every distribution matching the release specifications for
+        a package which is not already on every destination repository. The
+        package's index page is fetched once from each repository however
+        many specifications there are, and each distribution is downloaded
+        once however many destinations it is missing from.
 
-            for dist_link in to_sync:
-                self.sync_distribution(dist_link)
+        :param specs: One or more release specification strings, such as
+            ``pkgsync>0.1``, all for the same package.
+        :param listings: The package's listings as returned by `listings`, if
+            they have already been fetched.
+        :return: A tuple of two lists, the basenames of the distributions that
+            were synchronised and of those that could not be.
+        """
+        ui = ui or self.ui
+        specs = self._pending(specs, ui)
+        if not specs:
+            return [], []
+
+        ui.report('Checking required versions for %s...' % self._package_name(specs[0]))
+
+        required = self._required(specs, listings)
+
+        if not required:
+            ui.inline('up to date.')
+            self._done(specs)
+            return [], []
+
+        ui.inline('%s required' % ', '.join([d.version for spec, d, to, register in required]))
+
+        synced, failed = self.sync_distributions(
+            [d for spec, d, to, register in required], ui=ui,
+            destinations=[to for spec, d, to, register in required],
+            register_to=[register for spec, d, to, register in required],
+        )
+        self._done(specs, failed)
+        return synced, failed
+
+    def plan_package(self, specs, ui=None, listings=None):
+        """
+        Work out which distributions `sync_package` would synchronise for a
+        package, without downloading any of them.
+
+        :return: A list of `Plan` entries, one per distribution.
+        """
+        ui = ui or self.ui
+        specs = self._pending(specs, ui)
+        if not specs:
+            return []
+
+        ui.report('Planning required versions for %s...' % self._package_name(specs[0]))
+
+        entries = [
+            Plan.entry(
+                spec, d, size=d.content_length(),
+                destinations=[r.uri for r in to],
+                register=[r.uri for r in register],
+                metadata=d.metadata, hashes=d.hashes,
+            )
+            for spec, d, to, register in self._required(specs, listings)
+        ]
+
+        if entries:
+            ui.inline('%s required' % ', '.join([e['version'] for e in entries]))
+        else:
+            ui.inline('up to date.')
+        return entries
+
+    def execute_package(self, entries, ui=None):
+        """
+        Synchronise the distributions planned for one package.
+
+        :param entries: The `Plan` entries for a package, as yielded by
+            `Plan.packages`.
+        :return: A tuple of two lists, the basenames of the distributions that
+            were synchronised and of those that could not be.
+        """
+        ui = ui or self.ui
+        specs = self._pending(sorted(set(e['spec'] for e in entries)), ui)
+        if not specs:
+            return [], []
+
+        ui.report('Synchronising planned versions for %s...' % entries[0]['package'])
+
+        to_sync, destinations, register_to = [], [], []
+        for e in entries:
+            if not e['spec'] in specs:
+                continue
+            to = [
+                d for d in self.destinations
+                if d.uri in e.get('destinations', [d.uri])
+                and not self._has_uploaded(e['basename'], d)
+            ]
+            if to:
+                to_sync.append(RemoteDistribution(
+                    self.source, e['url'], e['package'], hashes=e.get('hashes'),
+                    size=e.get('size'), metadata=e.get('metadata'),
+                ))
+                destinations.append(to)
+                register_to.append([d for d in to if d.uri in e.get('register', [d.uri])])
+
+        synced, failed = self.sync_distributions(
+            to_sync, ui=ui, destinations=destinations, register_to=register_to,
+        )
+        self._done(specs, failed)
+        return synced, failed
+
+    def _buffered(self, method):
+        """ Wrap a per-package method so that, when run in a worker thread, its
+        output is reported all together once it is complete """
+        def buffered(item, **kwargs):
+            ui = BufferedReporter()
+            try:
+                return method(item, ui=ui, **kwargs)
+            finally:
+                with self._ui_lock:
+                    ui.replay(self.ui)
+        return buffered
+
+    def _map(self, method, items):
+        """
+        Call a per-package method with each of the given items, across
+        ``self.workers`` threads if there is more than one.
+
+        :return: yields the result of each call, in the order they complete.
+        """
+        if self.workers > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                for result in pool.imap_unordered(self._buffered(method), items):
+                    yield result
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for item in items:
+                yield method(item)
+
+    def _fetch_listings(self, job):
+        if [spec for spec in job.specs if not self.journal.is_package_done(spec)]:
+            job.listings = self.listings(job.specs)
+
+    def _map_listed(self, method, packages):
+        """
+        As `_map`, for a method which takes a package's listings. If
+        ``self.index_concurrency`` is set the listings for that many packages
+        are fetched at once, ahead of and apart from the ``self.workers``
+        threads calling the method.
+        """
+        if not self.index_concurrency:
+            for result in self._map(method, packages):
+                yield result
+            return
+
+        buffered = self._buffered(method)
+        def call(job):
+            job.result = buffered(job.specs, listings=job.listings)
+
+        pipeline = Pipeline(
+            [(self._fetch_listings, self.index_concurrency), (call, self.workers)],
+            maxsize=self.index_concurrency,
+        )
+        for job, error in pipeline.run(PackageJob(specs) for specs in packages):
+            yield job.result
+
+    def _record(self, result):
+        synced, failed = result
+        self.synced.extend(synced)
+        self.failed.extend(failed)
+
+    def summary(self):
+        self.ui.report('Synchronised %d distribution(s), %d failed.' % (
+            len(self.synced), len(self.failed)
+        ))
+
+    def sync(self):
+        """
+        Iterate alphabetically across each package named in self.include and
+        for each of the RemoteDistribution objects matching its specs
+        synchronise the package to each of the self.destinations
+        repositories, where the file does not already exist.
+
+        When ``self.workers`` is greater than 1 that many packages are
+        synchronised at once; output for each package is reported once that
+        package is complete.
+        """
+        self.synced, self.failed = [], []
+        for result in self._map_listed(self.sync_package, self.include.by_package()):
+            self._record(result)
+        self.summary()
+        return self.synced, self.failed
+
+    def plan(self):
+        """
+        Work out every distribution `sync` would synchronise, fetching the
+        index pages for ``self.workers`` packages at once but downloading
+        nothing.
+
+        :return: A `Plan` which can be passed to `execute`.
+        """
+        plan = Plan()
+        for entries in self._map_listed(self.plan_package, self.include.by_package()):
+            plan.extend(entries)
+        plan.sort(key=lambda e: (e['package'].lower(), e['basename']))
+        self.ui.report('Planned %d distribution(s), %d bytes.' % (len(plan), plan.size))
+        return plan
+
+    def execute(self, plan):
+        """
+        Synchronise the distributions in a `Plan` produced by `plan`, without
+        fetching any index pages.
+        """
+        self.synced, self.failed = [], []
+        for result in self._map(self.execute_package, plan.packages()):
+            self._record(result)
+        self.summary()
+        return self.synced, self.failed
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from StringIO import StringIO
+from unittest2 import TestCase
+
+from pkgsync.archive import read_metadata, SDist, BDist, Wheel
+
+PKG_INFO = 'Metadata-Version: 1.1\nName: %s\nVersion: 1.0\nClassifier: Framework :: Django\n'
+
+class ReadMetadataTest(TestCase):
+
+    def setUp(self):
+        self.assets_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'assets')
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def asset_path(self, basename):
+        return os.path.join(self.assets_path, basename)
+
+    def tar(self, basename, members):
+        path = os.path.join(self.dir, basename)
+        archive = tarfile.open(path, 'w:gz')
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, StringIO(data))
+        archive.close()
+        return path
+
+    def zip(self, basename, members):
+        path = os.path.join(self.dir, basename)
+        archive = zipfile.ZipFile(path, 'w')
+        for name, data in members:
+            archive.writestr(name, data)
+        archive.close()
+        return path
+
+    def test_sdist(self):
+        metadata = read_metadata(self.asset_path('somefakepackage-0.0.0.tar.gz'))
+        self.assertTrue(isinstance(metadata, SDist))
+        self.assertEqual(metadata.name, 'somefakepackage')
+        self.assertEqual(metadata.version, '0.0.0')
+
+    def test_egg(self):
+        metadata = read_metadata(self.asset_path('packagewithclassifiers-0.0.0-py2.7.egg'))
+        self.assertTrue(isinstance(metadata, BDist))
+        self.assertEqual(metadata.name, 'packagewithclassifiers')
+
+    def test_wheel(self):
+        path = self.zip('foo-1.0-py2-none-any.whl', [
+            ('foo/__init__.py', ''),
+            ('foo-1.0.dist-info/METADATA', 'Metadata-Version: 2.1\nName: foo\nVersion: 1.0\nSummary: Foo\n'),
+        ])
+        metadata = read_metadata(path)
+        self.assertTrue(isinstance(metadata, Wheel))
+        self.assertEqual((metadata.name, metadata.version, metadata.summary), ('foo', '1.0', 'Foo'))
+        self.assertEqual(metadata.filetype, 'bdist_wheel')
+
+    def test_description_in_body(self):
+        metadata = Wheel('foo-1.0-py2-none-any.whl', (
+            'Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n'
+            'Description-Content-Type: text/x-rst\n\n'
+            'Foo\n===\n\nLong description.\n'
+        ))
+        self.assertEqual(metadata.description, u'Foo\n===\n\nLong description.\n')
+
+        metadata = Wheel('foo-1.0-py2-none-any.whl', 'Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n')
+        self.assertEqual(metadata.description, None)
+
+    def test_zip_sdist(self):
+        path = self.zip('foo-1.0.zip', [
+            ('foo-1.0/vendor/bar.egg-info/PKG-INFO', PKG_INFO % 'bar'),
+            ('foo-1.0/PKG-INFO', PKG_INFO % 'foo'),
+        ])
+        self.assertEqual(read_metadata(path).name, 'foo')
+
+    def test_tar_stops_at_metadata(self):
+        path = self.tar('foo-1.0.tar.gz', [('foo-1.0/PKG-INFO', PKG_INFO % 'foo'), ('foo-1.0/big.bin', os.urandom(256 * 1024))])
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:len(data) // 2]) # everything after PKG-INFO is damaged
+        self.assertEqual(read_metadata(path).name, 'foo')
+
+    def test_tar_prefers_own_metadata(self):
+        path = self.tar('foo-1.0.tar.gz', [
+            ('foo-1.0/vendor/bar.egg-info/PKG-INFO', PKG_INFO % 'bar'),
+            ('foo-1.0/foo.egg-info/PKG-INFO', PKG_INFO % 'foo'),
+        ])
+        self.assertEqual(read_metadata(path).name, 'foo')
+
+        path = self.tar('bar-1.0.tar.gz', [('bar-1.0/vendor/bar.egg-info/PKG-INFO', PKG_INFO % 'bar')])
+        self.assertEqual(read_metadata(path).name, 'bar')
+
+    def test_no_metadata(self):
+        self.assertEqual(read_metadata(self.asset_path('AnOldStylePackage-1.5.4.tar.gz')), None)
+        self.assertEqual(read_metadata(self.tar('foo-1.0.tar.gz', [('foo-1.0/PKG-INFO', 'nonsense')])), None)
+        self.assertEqual(read_metadata(os.path.join(self.dir, 'missing-1.0.tar.gz')), None)
+        self.assertEqual(read_metadata(self.asset_path('../test_archive.py')), None)
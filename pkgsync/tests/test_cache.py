@@ -0,0 +1,185 @@
+import os
+import time
+import errno
+import shutil
+import tempfile
+import mock
+from unittest2 import TestCase
+
+from pkgsync.cache import IndexCache, DistributionCache, MetadataCache
+
+class IndexCacheTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.links = [(u'../../packages/pkgsync-0.1.0.tar.gz', u'pkgsync-0.1.0.tar.gz')]
+
+    def response(self, **headers):
+        return mock.Mock(headers=headers)
+
+    def test_miss(self):
+        cache = IndexCache(self.dir)
+        self.assertEqual(cache.get('http://example.com/simple/pkgsync/'), None)
+        self.assertEqual(IndexCache.conditional_headers(None), {})
+
+    def test_store(self):
+        cache = IndexCache(self.dir)
+        url = 'http://example.com/simple/pkgsync/'
+        cache.store(url, self.response(etag='"abc"', **{'last-modified': 'Sat, 02 Mar 2013 00:00:00 GMT'}), self.links)
+        entry = cache.get(url)
+        self.assertEqual([tuple(l) for l in entry['links']], self.links)
+        self.assertEqual(IndexCache.conditional_headers(entry), {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Sat, 02 Mar 2013 00:00:00 GMT',
+        })
+
+    def test_other_format_is_a_miss(self):
+        cache = IndexCache(self.dir)
+        url = 'http://example.com/simple/pkgsync/'
+        cache.store(url, self.response(etag='"abc"'), self.links)
+        with mock.patch.object(IndexCache, 'FORMAT', IndexCache.FORMAT + 1):
+            self.assertEqual(cache.get(url), None)
+
+    def test_no_validators(self):
+        cache = IndexCache(self.dir)
+        url = 'http://example.com/simple/pkgsync/'
+        cache.store(url, self.response(), self.links)
+        self.assertEqual(cache.get(url), None)
+
+    def test_lru_eviction(self):
+        cache = IndexCache(self.dir)
+        cache.store('http://example.com/simple/a/', self.response(etag='a'), self.links)
+        size = os.path.getsize(cache._path('http://example.com/simple/a/'))
+        cache = IndexCache(self.dir, max_bytes=size * 2 + 10)
+
+        cache.store('http://example.com/simple/b/', self.response(etag='b'), self.links)
+        past = time.time() - 100
+        os.utime(cache._path('http://example.com/simple/a/'), (past, past))
+        os.utime(cache._path('http://example.com/simple/b/'), (past + 1, past + 1))
+        cache.get('http://example.com/simple/a/') # now the most recently used
+
+        cache.store('http://example.com/simple/c/', self.response(etag='c'), self.links)
+        self.assertNotEqual(cache.get('http://example.com/simple/a/'), None)
+        self.assertEqual(cache.get('http://example.com/simple/b/'), None)
+        self.assertNotEqual(cache.get('http://example.com/simple/c/'), None)
+
+
+class DistributionCacheTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.cache_dir = os.path.join(self.dir, 'cache')
+
+    def download(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_miss(self):
+        cache = DistributionCache(self.cache_dir)
+        save_to = os.path.join(self.dir, 'pkgsync-0.1.0.tar.gz')
+        self.assertFalse(cache.get('md5', 'a' * 32, save_to))
+        self.assertFalse(os.path.exists(save_to))
+
+    def test_store_and_get(self):
+        cache = DistributionCache(self.cache_dir)
+        path = self.download('pkgsync-0.1.0.tar.gz', 'content')
+        cache.store('md5', 'a' * 32, path)
+        os.unlink(path) # as Sync does once uploaded
+
+        save_to = os.path.join(self.dir, 'elsewhere.tar.gz')
+        self.assertTrue(cache.get('md5', 'A' * 32, save_to))
+        self.assertEqual(self.read(save_to), 'content')
+
+    def test_copied_if_not_linked(self):
+        cache = DistributionCache(self.cache_dir)
+        path = self.download('pkgsync-0.1.0.tar.gz', 'content')
+        with mock.patch('os.link', side_effect=OSError(errno.EPERM, 'Operation not permitted')):
+            cache.store('md5', 'a' * 32, path)
+            save_to = os.path.join(self.dir, 'elsewhere.tar.gz')
+            self.assertTrue(cache.get('md5', 'a' * 32, save_to))
+        self.assertEqual(self.read(save_to), 'content')
+
+    def test_store_failure_skipped(self):
+        cache = DistributionCache(self.cache_dir)
+        path = self.download('pkgsync-0.1.0.tar.gz', 'content')
+        with mock.patch('os.link', side_effect=OSError(errno.EPERM, 'Operation not permitted')):
+            with mock.patch('shutil.copy2', side_effect=IOError(errno.ENOSPC, 'No space left on device')):
+                cache.store('md5', 'a' * 32, path)
+        self.assertFalse(cache.get('md5', 'a' * 32, os.path.join(self.dir, 'elsewhere.tar.gz')))
+        self.assertEqual(os.listdir(os.path.dirname(cache._path('md5', 'a' * 32))), [])
+
+    def test_size_kept_in_memory(self):
+        cache = DistributionCache(self.cache_dir, max_bytes=25)
+        cache.store('md5', 'a' * 32, self.download('a.tar.gz', '0123456789'))
+        with mock.patch('os.walk') as walk:
+            for digest in ['b' * 32, 'c' * 32, 'd' * 32]:
+                cache.store('md5', digest, self.download('%s.tar.gz' % digest[0], '0123456789'))
+            self.assertFalse(walk.called)
+        self.assertEqual(cache._size, 20)
+
+    def test_shared_by_processes(self):
+        first = DistributionCache(self.cache_dir, max_bytes=25, rescan_interval=0)
+        second = DistributionCache(self.cache_dir, max_bytes=25, rescan_interval=0)
+        for n, digest in enumerate(['a' * 32, 'b' * 32, 'c' * 32, 'd' * 32]):
+            cache = (first, second)[n % 2]
+            cache.store('md5', digest, self.download('%s.tar.gz' % n, '0123456789'))
+            sizes = [size for mtime, size, path in first._entries()]
+            self.assertTrue(sum(sizes) <= 25)
+
+    def test_lru_eviction(self):
+        cache = DistributionCache(self.cache_dir, max_bytes=25)
+        past = time.time() - 100
+        for n, digest in enumerate(['a' * 32, 'b' * 32]):
+            cache.store('md5', digest, self.download('%s.tar.gz' % n, '0123456789'))
+            os.utime(cache._path('md5', digest), (past + n, past + n))
+        cache.get('md5', 'a' * 32, os.path.join(self.dir, 'a.tar.gz'))
+
+        cache.store('md5', 'c' * 32, self.download('c.tar.gz', '0123456789'))
+        self.assertTrue(os.path.exists(cache._path('md5', 'a' * 32)))
+        self.assertFalse(os.path.exists(cache._path('md5', 'b' * 32)))
+        self.assertTrue(os.path.exists(cache._path('md5', 'c' * 32)))
+
+
+class MetadataCacheTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'cache', 'metadata.sqlite')
+
+    def test_store(self):
+        cache = MetadataCache(self.path)
+        self.assertEqual(cache.get('a' * 64), None)
+        cache.store('a' * 64, {'name': 'pkgsync', 'classifiers': ['A :: B']}, {'name': 'pkgsync'})
+        self.assertEqual(cache.get('a' * 64), ({'name': 'pkgsync', 'classifiers': ['A :: B']}, {'name': 'pkgsync'}))
+        cache.close()
+
+        cache = MetadataCache(self.path)
+        self.assertEqual(cache.get('a' * 64)[1], {'name': 'pkgsync'})
+        cache.close()
+
+    def test_store_register_later(self):
+        cache = MetadataCache(self.path)
+        cache.store('a' * 64, None, {'name': 'pkgsync'})
+        self.assertEqual(cache.get('a' * 64), (None, {'name': 'pkgsync'}))
+        cache.store_register('a' * 64, {'name': 'pkgsync'})
+        self.assertEqual(cache.get('a' * 64), ({'name': 'pkgsync'}, {'name': 'pkgsync'}))
+        cache.close()
+
+    def test_other_version_ignored(self):
+        cache = MetadataCache(self.path)
+        cache.store('a' * 64, {'name': 'pkgsync'}, {'name': 'pkgsync'})
+        cache.close()
+
+        with mock.patch.object(MetadataCache, 'VERSION', MetadataCache.VERSION + 1):
+            cache = MetadataCache(self.path)
+            self.assertEqual(cache.get('a' * 64), None)
+            cache.close()
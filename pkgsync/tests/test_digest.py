@@ -1,5 +1,7 @@
+import hashlib
 import tempfile
 from pkgsync.digest import IteratingMd5Checker, Md5MismatchException
+from pkgsync.digest import StreamingDigestChecker, DigestMismatchException, parse_fragment
 from unittest2 import TestCase
 
 class IteratingMd5CheckerTest(TestCase):
@@ -22,3 +24,42 @@ class IteratingMd5CheckerTest(TestCase):
         checker = IteratingMd5Checker(self.invalid_file.name, self.valid_sum)
         with self.assertRaises(Md5MismatchException):
             checker.check()
+
+
+class StreamingDigestCheckerTest(TestCase):
+
+    def setUp(self):
+        self.md5 = '9f8d067fdb2373a64b4c3e420f31f4cc'
+        self.sha256 = hashlib.sha256('loldongs\n').hexdigest()
+
+    def test_parse_fragment(self):
+        self.assertEqual(parse_fragment('sha256=ABC'), {'sha256': 'abc'})
+        self.assertEqual(parse_fragment('md5=abc'), {'md5': 'abc'})
+        self.assertEqual(parse_fragment('egg=pkgsync'), {})
+        self.assertEqual(parse_fragment(''), {})
+
+    def test_digests_in_one_pass(self):
+        checker = StreamingDigestChecker('/tmp/loldongs', {'sha256': self.sha256})
+        for chunk in ['lol', 'dongs', '\n']:
+            checker.update(chunk)
+        checker.check()
+        self.assertEqual(checker.hexdigests(), {'md5': self.md5, 'sha256': self.sha256})
+
+    def test_mismatch(self):
+        checker = StreamingDigestChecker('/tmp/loldongs', {'sha256': self.sha256, 'md5': self.md5})
+        checker.update('some other string')
+        with self.assertRaises(DigestMismatchException):
+            checker.check()
+
+    def test_md5_mismatch(self):
+        checker = StreamingDigestChecker('/tmp/loldongs', {'md5': self.md5})
+        checker.update('some other string')
+        with self.assertRaises(Md5MismatchException):
+            checker.check()
+
+    def test_extra_algorithm(self):
+        sha512 = hashlib.sha512('loldongs\n').hexdigest()
+        checker = StreamingDigestChecker('/tmp/loldongs', {'sha512': sha512, 'whirlpool': 'x'})
+        checker.update('loldongs\n')
+        checker.check()
+        self.assertEqual(sorted(checker.hexdigests()), ['md5', 'sha256', 'sha512'])
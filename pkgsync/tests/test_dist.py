@@ -1,8 +1,15 @@
 import os
+import mock
+import shutil
+import sqlite3
+import tempfile
+import hashlib
 from unittest2 import TestCase
-from pkgsync.dist import Distribution
+from pkgsync.dist import Distribution, Content, MetadataDistribution
+from pkgsync.exceptions import InvalidDistribution
 
-from pkgsync.meta import Metadata, OldStyleMetadata
+from pkgsync.meta import Metadata, OldStyleMetadata, CachedMetadata
+from pkgsync.cache import MetadataCache
 
 class DistributionTest(TestCase):
 
@@ -17,6 +24,15 @@ class DistributionTest(TestCase):
         d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'))
         self.assertTrue(isinstance(d.meta, Metadata))
 
+    def test_metadata_parsed_when_needed(self):
+        d = Distribution(self.asset_path('missing-0.0.0.tar.gz'))
+        self.assertEqual(d.basename, 'missing-0.0.0.tar.gz')
+        with mock.patch('pkgsync.dist.Metadata') as metadata:
+            d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'))
+            self.assertFalse(metadata.called)
+            self.assertTrue(d.meta is d.meta)
+            self.assertEqual(metadata.call_count, 1)
+
     def test_init_oldstyle(self):
         """ Ensure that `Distribution` is selecting the correct metadata class """
         d = Distribution(self.asset_path('AnOldStylePackage-1.5.4.tar.gz'))
@@ -30,6 +46,96 @@ class DistributionTest(TestCase):
         d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'))
         self.assertEqual(len(d.content), 906)
 
+    def test_content_chunks(self):
+        d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'))
+        content = Content(d.path, chunk_size=100)
+        chunks = list(content)
+        self.assertEqual([len(c) for c in chunks], [100] * 9 + [6])
+        with open(d.path, 'rb') as f:
+            self.assertEqual(''.join(chunks), f.read())
+        self.assertEqual(content.read(), ''.join(chunks))
+
     def test_md5_digest(self):
         d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'))
         self.assertEqual(d.md5_digest, '22ed441feb4fbfaf700b36260195b986')
+
+    def test_digests(self):
+        d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'))
+        with open(d.path, 'rb') as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(d.sha256_digest, sha256)
+        self.assertEqual(d.digests, {'md5': '22ed441feb4fbfaf700b36260195b986', 'sha256': sha256})
+
+    def test_known_digests(self):
+        d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'), digests={'md5': 'abc', 'sha256': 'def'})
+        self.assertEqual(d.md5_digest, 'abc')
+        self.assertEqual(d.sha256_digest, 'def')
+
+    def test_metadata_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = MetadataCache(os.path.join(cache_dir, 'metadata.sqlite'))
+        path = self.asset_path('packagewithclassifiers-0.0.0.tar.gz')
+
+        d = Distribution(path, metadata_cache=cache)
+        register, upload = d.meta.register(), d.meta.upload()
+
+        with mock.patch('pkgsync.dist.Metadata') as metadata:
+            cached = Distribution(path, metadata_cache=cache)
+            self.assertFalse(metadata.called)
+        self.assertTrue(isinstance(cached.meta, CachedMetadata))
+        self.assertEqual(cached.meta.register()['classifiers'], list(register['classifiers']))
+        self.assertEqual(cached.meta.register()['name'], register['name'])
+        cached_upload = cached.meta.upload()
+        self.assertEqual(cached_upload['content'][1].path, path)
+        del cached_upload['content'], upload['content']
+        self.assertEqual(cached_upload, upload)
+
+    def test_metadata_cache_upload_does_not_fix_up(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = MetadataCache(os.path.join(cache_dir, 'metadata.sqlite'))
+        path = self.asset_path('packagewithclassifiers-0.0.0.tar.gz')
+
+        with mock.patch.object(Metadata, '_fix') as fix:
+            d = Distribution(path, metadata_cache=cache)
+            self.assertEqual(d.meta.upload()['name'], 'packagewithclassifiers')
+            self.assertFalse(fix.called)
+        self.assertEqual(cache.get(d.sha256_digest)[0], None)
+
+        register = d.meta.register()
+        self.assertEqual(cache.get(d.sha256_digest)[0]['name'], register['name'])
+        with mock.patch('pkgsync.dist.Metadata') as metadata:
+            self.assertEqual(Distribution(path, metadata_cache=cache).meta.register()['name'], register['name'])
+            self.assertFalse(metadata.called)
+
+    def test_metadata_cache_register_parses_archive(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = MetadataCache(os.path.join(cache_dir, 'metadata.sqlite'))
+        path = self.asset_path('packagewithclassifiers-0.0.0.tar.gz')
+        Distribution(path, metadata_cache=cache).meta.upload()
+
+        d = Distribution(path, metadata_cache=cache)
+        self.assertTrue(isinstance(d.meta, CachedMetadata))
+        self.assertTrue(d.meta.register()['classifiers'])
+        self.assertTrue(cache.get(d.sha256_digest)[0]['classifiers'])
+
+    def test_metadata_cache_unavailable(self):
+        cache = mock.Mock()
+        cache.get.side_effect = sqlite3.OperationalError('database is locked')
+        cache.store.side_effect = sqlite3.OperationalError('database is locked')
+        d = Distribution(self.asset_path('somefakepackage-0.0.0.tar.gz'), metadata_cache=cache)
+        self.assertTrue(isinstance(d.meta, Metadata))
+        self.assertEqual(d.meta.upload()['name'], 'somefakepackage')
+
+    def test_metadata_distribution(self):
+        d = MetadataDistribution('foo-1.0-py2-none-any.whl', (
+            'Metadata-Version: 2.1\nName: foo\nVersion: 1.0\nSummary: Foo\n\n'
+            'Long description.\n'
+        ))
+        register = d.meta.register()
+        self.assertEqual((register['name'], register['version']), ('foo', '1.0'))
+        self.assertEqual(register['description'], 'Long description.\n')
+        with self.assertRaises(InvalidDistribution):
+            MetadataDistribution('foo-1.0-py2-none-any.whl', '<html>Not Found</html>')
@@ -0,0 +1,75 @@
+from unittest2 import TestCase
+
+from pkgsync.filename import FilenameParser, normalize
+
+class NormalizeTest(TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize('zc.recipe_egg'), 'zc-recipe-egg')
+        self.assertEqual(normalize('Django'), 'django')
+        self.assertEqual(normalize('a-_.b'), 'a-b')
+
+
+class FilenameParserTest(TestCase):
+
+    def setUp(self):
+        self.parser = FilenameParser()
+
+    def test_sdist(self):
+        self.assertEqual(self.parser.parse('pkgsync-0.1.0.tar.gz', 'pkgsync'), {
+            'version': '0.1.0', 'extension': '.tar.gz',
+        })
+        self.assertEqual(self.parser.parse('pkgsync-0.1.0.zip', 'pkgsync')['extension'], '.zip')
+        self.assertEqual(self.parser.parse('pkgsync-0.1.0.tar.bz2', 'pkgsync')['extension'], '.tar.bz2')
+
+    def test_egg(self):
+        self.assertEqual(self.parser.parse('pkgsync-0.1.0-py2.7.egg', 'pkgsync'), {
+            'version': '0.1.0', 'pyversion': 'py2.7', 'platform': None, 'extension': '.egg',
+        })
+        self.assertEqual(
+            self.parser.parse('lxml-3.1.0-py2.7-linux-x86_64.egg', 'lxml')['platform'],
+            'linux-x86_64',
+        )
+
+    def test_wheel(self):
+        self.assertEqual(self.parser.parse('pkgsync-0.1.0-py2.py3-none-any.whl', 'pkgsync'), {
+            'version': '0.1.0', 'build': None, 'pyversion': 'py2.py3',
+            'abi': 'none', 'platform': 'any', 'extension': '.whl',
+        })
+
+    def test_wheel_build_tag(self):
+        parsed = self.parser.parse('lxml-3.1.0-1-cp27-cp27mu-manylinux1_x86_64.whl', 'lxml')
+        self.assertEqual(parsed['build'], '1')
+        self.assertEqual(parsed['abi'], 'cp27mu')
+        self.assertEqual(parsed['platform'], 'manylinux1_x86_64')
+
+    def test_wheel_normalized_name(self):
+        parsed = self.parser.parse('zc_recipe_egg-1.2.3-py2-none-any.whl', 'zc.recipe.egg')
+        self.assertEqual(parsed['version'], '1.2.3')
+
+    def test_equivalent_names(self):
+        self.assertEqual(self.parser.parse('Django-1.4.5.tar.gz', 'django')['version'], '1.4.5')
+        self.assertEqual(self.parser.parse('zc_buildout-1.4.3.tar.gz', 'zc.buildout')['version'], '1.4.3')
+
+    def test_other_package(self):
+        self.assertEqual(self.parser.parse('pkgsyncer-0.1.0.tar.gz', 'pkgsync'), None)
+        self.assertEqual(self.parser.parse('other-0.1.0-py2-none-any.whl', 'pkgsync'), None)
+        self.assertEqual(self.parser.parse('pkgsync-0.1.0.exe', 'pkgsync'), None)
+
+    def test_memoized(self):
+        first = self.parser.parse('pkgsync-0.1.0.tar.gz', 'pkgsync')
+        first['version'] = 'changed'
+        self.assertEqual(self.parser.parse('pkgsync-0.1.0.tar.gz', 'pkgsync')['version'], '0.1.0')
+        self.assertEqual(len(self.parser._patterns), 1)
+
+    def test_cache_bounded(self):
+        parser = FilenameParser(max_cached=2)
+        for version in range(5):
+            parser.parse('pkgsync-0.%d.tar.gz' % version, 'pkgsync')
+        self.assertTrue(len(parser._parsed) <= 2)
+
+    def test_patterns_bounded(self):
+        parser = FilenameParser(max_patterns=2)
+        for n in range(5):
+            self.assertEqual(parser.parse('package%d-0.1.tar.gz' % n, 'package%d' % n)['version'], '0.1')
+        self.assertTrue(len(parser._patterns) <= 2)
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+from unittest2 import TestCase
+
+from pkgsync.journal import Journal
+
+class JournalTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'journal')
+
+    def test_record(self):
+        journal = Journal(self.path)
+        journal.uploaded('pkgsync-0.1.0.tar.gz')
+        journal.package_done('pkgsync>=0.1')
+        self.assertTrue(journal.has_uploaded('pkgsync-0.1.0.tar.gz'))
+        self.assertTrue(journal.is_package_done('pkgsync>=0.1'))
+        self.assertFalse(journal.is_package_done('pkgsync'))
+        journal.close()
+
+    def test_resume(self):
+        journal = Journal(self.path)
+        journal.uploaded('pkgsync-0.1.0.tar.gz')
+        journal.package_done('pkgsync>=0.1')
+        journal.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertTrue(journal.has_uploaded('pkgsync-0.1.0.tar.gz'))
+        self.assertTrue(journal.is_package_done('pkgsync>=0.1'))
+        journal.package_done('Django')
+        journal.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.packages, set(['pkgsync>=0.1', 'Django']))
+        journal.close()
+
+    def test_uploaded_per_destination(self):
+        journal = Journal(self.path)
+        journal.uploaded('pkgsync-0.1.0.tar.gz', 'https://first.example.com')
+        journal.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertTrue(journal.has_uploaded('pkgsync-0.1.0.tar.gz', 'https://first.example.com'))
+        self.assertFalse(journal.has_uploaded('pkgsync-0.1.0.tar.gz', 'https://second.example.com'))
+        self.assertFalse(journal.has_uploaded('pkgsync-0.1.0.tar.gz'))
+        journal.close()
+
+    def test_no_resume_starts_afresh(self):
+        journal = Journal(self.path)
+        journal.package_done('pkgsync>=0.1')
+        journal.close()
+
+        journal = Journal(self.path)
+        self.assertFalse(journal.is_package_done('pkgsync>=0.1'))
+        journal.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.packages, set())
+        journal.close()
+
+    def test_partial_entry_ignored(self):
+        with open(self.path, 'w') as f:
+            f.write('package\tpkgsync>=0.1\nupload\tDjango-1.4.5.tar.g')
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.packages, set(['pkgsync>=0.1']))
+        self.assertEqual(journal.uploads, set())
+        journal.uploaded('Django-1.4.5.tar.gz')
+        journal.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.uploads, set(['Django-1.4.5.tar.gz']))
+        journal.close()
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'package\tpkgsync>=0.1\nupload\tDjango-1.4.5.tar.gz\n')
@@ -0,0 +1,37 @@
+from unittest2 import TestCase
+
+from pkgsync.links import iter_links
+
+class IterLinksTest(TestCase):
+
+    def test_links(self):
+        page = '<html><body><a href="a.tar.gz">a</a><br/><a href="b.zip">b</a></body></html>'
+        self.assertEqual(list(iter_links([page])), [(u'a.tar.gz', u'a'), (u'b.zip', u'b')])
+
+    def test_incremental(self):
+        """ A link is yielded before the rest of the page has been read """
+        def chunks():
+            yield '<html><body><a href="a.tar.gz">a</a>'
+            raise AssertionError('read too far')
+        links = iter_links(chunks())
+        self.assertEqual(links.next(), (u'a.tar.gz', u'a'))
+
+    def test_split_tags(self):
+        page = '<a href="a-1.0.tar.gz#md5=abc">a-1.0.tar.gz</a>'
+        chunks = [page[i:i + 3] for i in range(0, len(page), 3)]
+        self.assertEqual(list(iter_links(chunks)), [(u'a-1.0.tar.gz#md5=abc', u'a-1.0.tar.gz')])
+
+    def test_unclosed(self):
+        page = '<p><a href="a.tar.gz">a<a href="b.tar.gz">b'
+        self.assertEqual(list(iter_links([page])), [(u'a.tar.gz', u'a'), (u'b.tar.gz', u'b')])
+
+    def test_utf8(self):
+        page = u'<a href="caf\xe9-1.0.tar.gz">caf\xe9</a>'.encode('utf-8')
+        self.assertEqual(list(iter_links([page[:13], page[13:]])), [(u'caf\xe9-1.0.tar.gz', u'caf\xe9')])
+
+    def test_attributes(self):
+        page = '<a href="a-1.0.tar.gz" data-core-metadata="sha256=abc" rel="x">a</a><a href="b.zip">b</a>'
+        self.assertEqual(list(iter_links([page], attributes=('data-core-metadata',))), [
+            (u'a-1.0.tar.gz', u'a', {'data-core-metadata': u'sha256=abc'}),
+            (u'b.zip', u'b', {}),
+        ])
@@ -0,0 +1,59 @@
+from unittest2 import TestCase
+import mock
+
+from pkgsync.listing import Listing
+from pkgsync.remote import RemoteDistribution
+from pkgsync.exceptions import InvalidRemoteDistribution
+
+class ListingTest(TestCase):
+
+    def setUp(self):
+        self.repo = mock.Mock()
+        self.repo.package_index.return_value = 'https://example.com/simple/pkgsync/'
+        self.listing = Listing(self.repo, 'pkgsync')
+
+    def test_add(self):
+        listed = self.listing.add('../../packages/pkgsync-0.1.0.tar.gz#md5=c264ffd778c274561842237d6253427a')
+        self.assertEqual(list(self.listing), [listed])
+        self.assertEqual(listed.basename, 'pkgsync-0.1.0.tar.gz')
+        self.assertEqual(listed.version, '0.1.0')
+        self.assertEqual(listed.extension, '.tar.gz')
+        self.assertEqual(listed.md5_digest, 'c264ffd778c274561842237d6253427a')
+        self.assertEqual(listed.digests, {'md5': 'c264ffd778c274561842237d6253427a'})
+        self.assertEqual(listed.package_name, 'pkgsync')
+
+    def test_invalid(self):
+        with self.assertRaises(InvalidRemoteDistribution):
+            self.listing.add('../../packages/something-else-1.0.tar.gz')
+        self.assertEqual(len(self.listing), 0)
+
+    def test_hashes(self):
+        listed = self.listing.add('pkgsync-0.1.0.tar.gz', hashes={'sha256': 'a' * 64}, size=10)
+        self.assertEqual(listed.md5_digest, None)
+        self.assertEqual(listed.digests, {'sha256': 'a' * 64})
+        self.assertFalse(listed.same_content(mock.Mock(digests={'sha256': 'b' * 64})))
+        self.assertTrue(listed.same_content(mock.Mock(digests={'md5': 'b' * 32})))
+
+    def test_digests_match_remote(self):
+        listed = self.listing.add('pkgsync-0.1.0.tar.gz#md5=' + 'c' * 32, hashes={'sha256': 'a' * 64})
+        remote = RemoteDistribution(self.repo, listed.path, 'pkgsync', hashes=listed.hashes)
+        self.assertEqual(listed.digests, remote.digests)
+        self.assertTrue(listed.same_content(remote))
+        self.assertTrue(remote.same_content(listed))
+
+    def test_remote_created_when_needed(self):
+        listed = self.listing.add('pkgsync-0.1.0-py2.7.egg', size=10)
+        self.assertFalse(self.repo.package_index.called)
+        self.assertEqual(listed.url, 'https://example.com/simple/pkgsync/pkgsync-0.1.0-py2.7.egg')
+        self.assertEqual(listed.pyversion, 'py2.7')
+        self.assertEqual(listed.content_length(), 10)
+        self.assertTrue(isinstance(listed.remote, RemoteDistribution))
+        self.assertTrue(listed.remote is listed.remote)
+
+    def test_select_and_diff(self):
+        a = self.listing.add('pkgsync-0.1.0.tar.gz')
+        b = self.listing.add('pkgsync-0.2.0.tar.gz')
+        self.assertEqual(list(RemoteDistribution.select(self.listing, 'pkgsync>0.1')), [b])
+        other = Listing(self.repo, 'pkgsync')
+        other.add('pkgsync-0.1.0.tar.gz')
+        self.assertEqual(RemoteDistribution.diff(self.listing, other), [b])
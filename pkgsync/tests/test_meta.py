@@ -3,6 +3,7 @@ import mock
 from unittest import TestCase, skip
 
 from pkgsync.meta import Metadata, OldStyleMetadata
+from pkgsync.archive import Wheel
 from pkgsync.exceptions import InvalidDistribution
 
 class OldStyleMetadataTest(TestCase):
@@ -102,6 +103,14 @@ class MetadataTest(TestCase):
             'content': ('somefakepackage-0.0.0.tar.gz', ''),
         })
 
+    def test_upload_wheel(self):
+        basename = 'some_fake.package-0.0.0-py2.py3-none-any.whl'
+        distribution = mock.Mock(md5_digest='0'*32, basename=basename, content='')
+        raw = Wheel(basename, 'Metadata-Version: 2.1\nName: some-fake.package\nVersion: 0.0.0\n', '2.1')
+        upload = Metadata(distribution, raw=raw).upload()
+        self.assertEqual(upload['filetype'], 'bdist_wheel')
+        self.assertEqual(upload['pyversion'], 'py2.py3')
+
     def test_register(self):
         distribution = mock.Mock(
             path=self.asset_path('somefakepackage-0.0.0.tar.gz')
@@ -159,3 +168,19 @@ class MetadataTest(TestCase):
         self.assertEqual(metadata.register()['keywords'], [
             u'testing', u'space', u'separated', u'keywords'
         ])
+
+    def test_upload_does_not_fix_up(self):
+        distribution = mock.Mock(
+            path=self.asset_path('packagewithkeywords-0.0.0.tar.gz'),
+            md5_digest='0'*32,
+            basename='packagewithkeywords-0.0.0.tar.gz',
+            content='',
+        )
+        metadata = Metadata(distribution)
+        with mock.patch.object(Metadata, '_fix') as fix:
+            self.assertEqual(metadata.upload()['name'], u'packagewithkeywords')
+            self.assertFalse(fix.called)
+            metadata.register()
+            self.assertEqual(fix.call_count, 1)
+            metadata.register()
+            self.assertEqual(fix.call_count, 1)
@@ -0,0 +1,77 @@
+import threading
+from unittest2 import TestCase
+
+from pkgsync.pipeline import Pipeline
+
+class PipelineTest(TestCase):
+
+    def test_order(self):
+        seen = []
+        pipeline = Pipeline([lambda i: seen.append(('a', i)), lambda i: seen.append(('b', i))])
+        results = list(pipeline.run(range(5)))
+        self.assertEqual(results, [(i, None) for i in range(5)])
+        self.assertEqual([i for stage, i in seen if stage == 'b'], range(5))
+
+    def test_empty(self):
+        pipeline = Pipeline([lambda i: None])
+        self.assertEqual(list(pipeline.run([])), [])
+
+    def test_expected_error(self):
+        uploaded = []
+        def fetch(i):
+            if i == 1:
+                raise ValueError(i)
+        pipeline = Pipeline([fetch, uploaded.append], expected=(ValueError,))
+        results = list(pipeline.run(range(3)))
+        self.assertEqual([i for i, error in results], [0, 1, 2])
+        self.assertTrue(isinstance(results[1][1], ValueError))
+        self.assertEqual(uploaded, [0, 2])
+
+    def test_unexpected_error(self):
+        def fetch(i):
+            if i == 3:
+                raise IOError(i)
+        pipeline = Pipeline([fetch, lambda i: None], expected=(ValueError,))
+        with self.assertRaises(IOError):
+            list(pipeline.run(range(100)))
+
+    def test_stages_overlap(self):
+        """ The second item is fetched while the first is still uploading """
+        second_fetched = threading.Event()
+        def fetch(i):
+            if i == 1:
+                second_fetched.set()
+        def upload(i):
+            if i == 0:
+                self.assertTrue(second_fetched.wait(5))
+        pipeline = Pipeline([fetch, upload])
+        self.assertEqual(list(pipeline.run([0, 1])), [(0, None), (1, None)])
+
+    def test_abandoned(self):
+        pipeline = Pipeline([lambda i: None, lambda i: None])
+        results = pipeline.run(range(100))
+        results.next()
+        results.close()
+
+    def test_threaded_stage(self):
+        """ Every item is in a stage with several threads at the same time """
+        arrived = []
+        lock = threading.Lock()
+        all_arrived = threading.Event()
+        def fetch(i):
+            with lock:
+                arrived.append(i)
+                if len(arrived) == 4:
+                    all_arrived.set()
+            self.assertTrue(all_arrived.wait(5))
+        pipeline = Pipeline([(fetch, 4), lambda i: None], maxsize=4)
+        results = list(pipeline.run(range(4)))
+        self.assertEqual(sorted(i for i, error in results), range(4))
+
+    def test_threaded_stage_error(self):
+        def fetch(i):
+            if i == 7:
+                raise IOError(i)
+        pipeline = Pipeline([(fetch, 5), lambda i: None])
+        with self.assertRaises(IOError):
+            list(pipeline.run(range(50)))
@@ -0,0 +1,50 @@
+import mock
+from StringIO import StringIO
+from unittest2 import TestCase
+
+from pkgsync.plan import Plan
+
+class PlanTest(TestCase):
+
+    def link(self, package_name, version, basename):
+        return mock.Mock(
+            package_name=package_name, version=version, basename=basename,
+            url='https://example.com/packages/%s#md5=%s' % (basename, '0'*32),
+        )
+
+    def plan(self):
+        return Plan([
+            Plan.entry('foo>1.0', self.link('foo', '1.1', 'foo-1.1.tar.gz'), size=100),
+            Plan.entry('bar', self.link('bar', '0.1', 'bar-0.1.zip')),
+            Plan.entry('foo>1.0', self.link('foo', '1.2', 'foo-1.2.tar.gz'), size=50),
+        ])
+
+    def test_entry(self):
+        self.assertEqual(self.plan()[0], {
+            'spec': 'foo>1.0',
+            'package': 'foo',
+            'version': '1.1',
+            'basename': 'foo-1.1.tar.gz',
+            'url': 'https://example.com/packages/foo-1.1.tar.gz#md5=%s' % ('0'*32),
+            'size': 100,
+        })
+
+    def test_entry_hashes(self):
+        entry = Plan.entry('foo', self.link('foo', '1.1', 'foo-1.1.tar.gz'), hashes={'sha256': 'a' * 64})
+        self.assertEqual(entry['hashes'], {'sha256': 'a' * 64})
+        self.assertFalse('hashes' in Plan.entry('foo', self.link('foo', '1.1', 'foo-1.1.tar.gz'), hashes={}))
+
+    def test_size(self):
+        self.assertEqual(self.plan().size, 150)
+
+    def test_packages(self):
+        packages = list(self.plan().packages())
+        self.assertEqual([entries[0]['package'] for entries in packages], ['foo', 'bar'])
+        self.assertEqual([e['version'] for e in packages[0]], ['1.1', '1.2'])
+
+    def test_round_trip(self):
+        plan = self.plan()
+        fp = StringIO()
+        plan.dump(fp)
+        fp.seek(0)
+        self.assertEqual(Plan.from_fp(fp), plan)
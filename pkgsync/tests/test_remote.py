@@ -1,8 +1,14 @@
 from pkgsync.remote import RemoteDistribution
+from pkgsync.digest import Md5MismatchException, DigestMismatchException
+import hashlib
+from pkgsync.exceptions import MetadataUnavailable, DownloadFailed
+from pkgsync.cache import DistributionCache
 from unittest2 import TestCase
 import tempfile
 import shutil
 import mock
+import requests
+import fcntl
 import os
 
 class RemoteDistributionTest(TestCase):
@@ -15,7 +21,11 @@ class RemoteDistributionTest(TestCase):
     def mock_repo(self):
         repo = mock.Mock()
         repo.package_index.return_value = 'https://example.com/simple/pkgsync/'
-        mock_response = mock.Mock(content=self.empty_tgz)
+        content = self.empty_tgz
+        chunks = lambda size: [content[i:i + size] for i in range(0, len(content), size)]
+        mock_response = mock.Mock(
+            status_code=200, headers={}, iter_content=mock.Mock(side_effect=chunks)
+        )
         repo.get.return_value = mock_response
         return repo
 
@@ -47,6 +57,19 @@ class RemoteDistributionTest(TestCase):
         self.assertEqual(rd.md5_digest, 'ee6fbb8ee50e9b9d1bda8df6428090ca')
         self.assertEqual(rd.url, 'https://example.com/packages/2.7/p/pkgsync/pkgsync-0.1.0-py2.7.egg#md5=ee6fbb8ee50e9b9d1bda8df6428090ca')
 
+    def test_wheel_attributes(self):
+        rd = RemoteDistribution(
+            self.mock_repo(),
+            '../../packages/2.7/p/pkgsync/pkgsync-0.1.0-py2-none-any.whl#md5=ee6fbb8ee50e9b9d1bda8df6428090ca',
+            'pkgsync',
+        )
+        self.assertEqual(rd.basename, 'pkgsync-0.1.0-py2-none-any.whl')
+        self.assertEqual(rd.version, '0.1.0')
+        self.assertEqual(rd.extension, '.whl')
+        self.assertEqual(rd.pyversion, 'py2')
+        self.assertEqual(rd.abi, 'none')
+        self.assertEqual(rd.platform, 'any')
+
     def test_no_md5(self):
         rd = RemoteDistribution(
             self.mock_repo(),
@@ -55,6 +78,15 @@ class RemoteDistributionTest(TestCase):
         )
         self.assertEqual(rd.md5_digest, None)
 
+    def test_content_length(self):
+        repo = self.mock_repo()
+        repo.head.return_value = mock.Mock(headers={'content-length': '906'})
+        rd = RemoteDistribution(repo, '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz', 'pkgsync')
+        self.assertEqual(rd.content_length(), 906)
+
+        repo.head.return_value = mock.Mock(headers={})
+        self.assertEqual(rd.content_length(), None)
+
     def test_download(self):
         test_dir = tempfile.mkdtemp()
         self.dirs.append(test_dir)
@@ -68,6 +100,238 @@ class RemoteDistributionTest(TestCase):
         self.assertTrue(os.path.isfile(downloaded_file_path))
         self.assertEqual(dist.path, downloaded_file_path)
 
+    def test_download_chunked(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        repo = self.mock_repo()
+        rd = RemoteDistribution(
+            repo,
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % self.empty_digest,
+            'pkgsync',
+        )
+        dist = rd.download(save_to=test_dir, chunk_size=7)
+        repo.get.assert_called_with(rd.url, stream=True)
+        with open(dist.path, 'rb') as f:
+            self.assertEqual(f.read(), self.empty_tgz)
+        with mock.patch('pkgsync.dist.open', create=True) as mock_open:
+            self.assertEqual(dist.md5_digest, self.empty_digest)
+            self.assertFalse(mock_open.called)
+
+    def test_download_md5_mismatch(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        rd = RemoteDistribution(
+            self.mock_repo(),
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % ('0' * 32),
+            'pkgsync',
+        )
+        with self.assertRaises(Md5MismatchException):
+            rd.download(save_to=test_dir)
+        self.assertFalse(os.path.exists(os.path.join(test_dir, 'pkgsync-0.1.0.tar.gz')))
+
+    def test_download_sha256(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        sha256 = hashlib.sha256(self.empty_tgz).hexdigest()
+        rd = RemoteDistribution(
+            self.mock_repo(),
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#sha256=%s' % sha256,
+            'pkgsync',
+        )
+        self.assertEqual(rd.md5_digest, None)
+        self.assertEqual(rd.digests, {'sha256': sha256})
+        dist = rd.download(save_to=test_dir)
+        with mock.patch('pkgsync.dist.open', create=True) as mock_open:
+            self.assertEqual(dist.sha256_digest, sha256)
+            self.assertEqual(dist.md5_digest, self.empty_digest)
+            self.assertFalse(mock_open.called)
+
+    def test_download_sha256_mismatch(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        rd = RemoteDistribution(
+            self.mock_repo(),
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#sha256=%s' % ('0' * 64),
+            'pkgsync',
+        )
+        with self.assertRaises(DigestMismatchException):
+            rd.download(save_to=test_dir)
+        self.assertFalse(os.path.exists(os.path.join(test_dir, 'pkgsync-0.1.0.tar.gz')))
+
+    def test_unknown_fragment(self):
+        rd = RemoteDistribution(
+            self.mock_repo(),
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#egg=pkgsync',
+            'pkgsync',
+        )
+        self.assertEqual(rd.md5_digest, None)
+        self.assertEqual(rd.digests, {})
+
+    def test_fetch_metadata(self):
+        data = 'Metadata-Version: 1.1\nName: pkgsync\nVersion: 0.1.0\n'
+        repo = self.mock_repo()
+        repo.get.return_value = mock.Mock(status_code=200, content=data)
+        rd = RemoteDistribution(
+            repo, '../../packages/pkgsync-0.1.0.tar.gz#md5=abc', 'pkgsync',
+            metadata={'sha256': hashlib.sha256(data).hexdigest()},
+        )
+        self.assertEqual(rd.fetch_metadata(), data)
+        repo.get.assert_called_with('https://example.com/packages/pkgsync-0.1.0.tar.gz.metadata')
+
+        rd.metadata = {'sha256': '0' * 64}
+        with self.assertRaises(DigestMismatchException):
+            rd.fetch_metadata()
+
+    def test_no_metadata_file(self):
+        repo = self.mock_repo()
+        rd = RemoteDistribution(repo, '../../packages/pkgsync-0.1.0.tar.gz', 'pkgsync')
+        with self.assertRaises(MetadataUnavailable):
+            rd.fetch_metadata()
+        self.assertFalse(repo.get.called)
+
+        repo.get.return_value = mock.Mock(status_code=404)
+        rd = RemoteDistribution(repo, '../../packages/pkgsync-0.1.0.tar.gz', 'pkgsync', metadata={})
+        with self.assertRaises(MetadataUnavailable):
+            rd.fetch_metadata()
+
+    def interrupted_response(self, content, at, **headers):
+        def chunks(size):
+            yield content[:at]
+            raise requests.ConnectionError('connection reset')
+        return mock.Mock(status_code=200, headers=headers, iter_content=mock.Mock(side_effect=chunks))
+
+    def test_download_resumed(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        repo = self.mock_repo()
+        content = self.empty_tgz
+        rest = mock.Mock(
+            status_code=206,
+            headers={'content-range': 'bytes 20-%d/%d' % (len(content) - 1, len(content))},
+            iter_content=mock.Mock(return_value=[content[20:]]),
+        )
+        repo.get.side_effect = [self.interrupted_response(content, 20, etag='"abc"'), rest]
+        rd = RemoteDistribution(
+            repo,
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % self.empty_digest,
+            'pkgsync',
+        )
+        dist = rd.download(save_to=test_dir)
+
+        self.assertEqual(repo.get.call_args[1]['headers'], {'Range': 'bytes=20-', 'If-Range': '"abc"'})
+        with open(dist.path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(dist.md5_digest, self.empty_digest)
+        self.assertEqual(os.listdir(test_dir), ['pkgsync-0.1.0.tar.gz'])
+
+    def test_download_changed_since_interrupted(self):
+        """ The server sends the whole file if it has changed since the partial download """
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        repo = self.mock_repo()
+        content = self.empty_tgz
+        whole = mock.Mock(status_code=200, headers={}, iter_content=mock.Mock(return_value=[content]))
+        repo.get.side_effect = [self.interrupted_response('x' * 100, 20, etag='"abc"'), whole]
+        rd = RemoteDistribution(
+            repo,
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % self.empty_digest,
+            'pkgsync',
+        )
+        dist = rd.download(save_to=test_dir)
+        with open(dist.path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_download_already_complete(self):
+        """ A partial file which is already complete is downloaded again """
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        path = os.path.join(test_dir, 'pkgsync-0.1.0.tar.gz')
+        with open(path + '.part', 'wb') as f:
+            f.write(self.empty_tgz)
+        with open(path + '.part.validator', 'w') as f:
+            f.write('"abc"')
+        repo = self.mock_repo()
+        whole = repo.get.return_value
+        unsatisfiable = mock.Mock(status_code=416, headers={}, iter_content=mock.Mock(return_value=['<html>416</html>']))
+        repo.get.side_effect = [unsatisfiable, whole]
+        rd = RemoteDistribution(
+            repo,
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % self.empty_digest,
+            'pkgsync',
+        )
+        dist = rd.download(save_to=test_dir)
+        self.assertFalse('headers' in repo.get.call_args[1])
+        with open(dist.path, 'rb') as f:
+            self.assertEqual(f.read(), self.empty_tgz)
+
+    def test_download_error_status(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        repo = self.mock_repo()
+        repo.get.return_value = mock.Mock(status_code=503, headers={}, iter_content=mock.Mock(return_value=['<html>503</html>']))
+        rd = RemoteDistribution(repo, '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz', 'pkgsync')
+        with self.assertRaises(DownloadFailed):
+            rd.download(save_to=test_dir)
+        self.assertEqual(os.listdir(test_dir), [])
+
+    def test_download_partial_file_locked(self):
+        """ A partial file another process is downloading to is left alone """
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        part_path = os.path.join(test_dir, 'pkgsync-0.1.0.tar.gz.part')
+        with open(part_path, 'wb') as f:
+            f.write('another process')
+        fd = os.open(part_path, os.O_RDWR)
+        self.addCleanup(os.close, fd)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        repo = self.mock_repo()
+        rd = RemoteDistribution(
+            repo,
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % self.empty_digest,
+            'pkgsync',
+        )
+        dist = rd.download(save_to=test_dir)
+        self.assertFalse('headers' in repo.get.call_args[1])
+        with open(dist.path, 'rb') as f:
+            self.assertEqual(f.read(), self.empty_tgz)
+        with open(part_path, 'rb') as f:
+            self.assertEqual(f.read(), 'another process')
+        self.assertEqual(sorted(os.listdir(test_dir)), ['pkgsync-0.1.0.tar.gz', 'pkgsync-0.1.0.tar.gz.part'])
+
+    def test_download_gives_up(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        repo = self.mock_repo()
+        repo.get.side_effect = lambda *args, **kwargs: self.interrupted_response(self.empty_tgz, 10, etag='"abc"')
+        rd = RemoteDistribution(
+            repo,
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % self.empty_digest,
+            'pkgsync',
+        )
+        with self.assertRaises(requests.ConnectionError):
+            rd.download(save_to=test_dir, retries=1)
+        self.assertEqual(repo.get.call_count, 2)
+        self.assertTrue(os.path.exists(os.path.join(test_dir, 'pkgsync-0.1.0.tar.gz.part')))
+
+    def test_download_cache(self):
+        test_dir = tempfile.mkdtemp()
+        self.dirs.append(test_dir)
+        cache = DistributionCache(os.path.join(test_dir, 'cache'))
+        repo = self.mock_repo()
+        rd = RemoteDistribution(
+            repo,
+            '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s' % self.empty_digest,
+            'pkgsync',
+        )
+        dist = rd.download(save_to=test_dir, cache=cache)
+        os.unlink(dist.path)
+
+        dist = rd.download(save_to=test_dir, cache=cache)
+        self.assertEqual(repo.get.call_count, 1)
+        with open(dist.path, 'rb') as f:
+            self.assertEqual(f.read(), self.empty_tgz)
+
     def test_empty_diff(self):
         self.assertEqual(RemoteDistribution.diff([], []), [])
 
@@ -108,3 +372,26 @@ class RemoteDistributionTest(TestCase):
             'pkgsync',
         )
         self.assertEqual(RemoteDistribution.diff([zip_d, tgz_d], [tgz_d]), [zip_d])
+
+    def test_diff_digests(self):
+        repo = self.mock_repo()
+        path = '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz#md5=%s'
+        source = RemoteDistribution(repo, path % self.empty_digest, 'pkgsync')
+        same = RemoteDistribution(repo, path % self.empty_digest, 'pkgsync')
+        changed = RemoteDistribution(repo, path % ('0' * 32), 'pkgsync')
+        unknown = RemoteDistribution(repo, '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz', 'pkgsync')
+
+        self.assertEqual(RemoteDistribution.diff([source], [changed]), [])
+        self.assertEqual(RemoteDistribution.diff([source], [changed], compare_digests=True), [source])
+        self.assertEqual(RemoteDistribution.diff([source], [same], compare_digests=True), [])
+        self.assertEqual(RemoteDistribution.diff([source], [unknown], compare_digests=True), [])
+
+    def test_diff_digests_by_kind(self):
+        repo = self.mock_repo()
+        path = '../../packages/source/p/pkgsync/pkgsync-0.1.0.tar.gz'
+        source = RemoteDistribution(repo, path, 'pkgsync', hashes={'sha256': 'a' * 64, 'md5': self.empty_digest})
+        md5_only = RemoteDistribution(repo, path + '#md5=%s' % self.empty_digest, 'pkgsync')
+        other_sha = RemoteDistribution(repo, path, 'pkgsync', hashes={'sha256': 'b' * 64})
+
+        self.assertEqual(RemoteDistribution.diff([source], [md5_only], compare_digests=True), [])
+        self.assertEqual(RemoteDistribution.diff([source], [other_sha], compare_digests=True), [source])
@@ -0,0 +1,278 @@
+from unittest2 import TestCase
+import mock
+
+from pkgsync.sync import Sync
+from pkgsync.versions import Versions
+from pkgsync.status import BufferedReporter
+from pkgsync.exceptions import InvalidDistribution, MetadataUnavailable, DownloadFailed
+from pkgsync.digest import DigestMismatchException
+
+class SyncTest(TestCase):
+
+    def mock_link(self, basename, version, metadata=None):
+        link = mock.Mock(basename=basename, version=version, metadata=metadata)
+        link.download.return_value = mock.Mock(path='/nonexistent/%s' % basename)
+        return link
+
+    def mock_destination(self, destination_links=None, uri='https://destination.example.com'):
+        destination_links = destination_links or {}
+        destination = mock.Mock(uri=uri)
+        destination.upload.return_value = (200, '')
+        destination.all_distributions.side_effect = lambda name: iter(destination_links.get(name.lower(), []))
+        return destination
+
+    def mock_repos(self, source_links, destination_links=None):
+        source = mock.Mock()
+        source.all_distributions.side_effect = lambda name: iter(source_links.get(name.lower(), []))
+        return source, self.mock_destination(destination_links)
+
+    def links(self):
+        return {
+            'foo': [self.mock_link('foo-1.0.tar.gz', '1.0'), self.mock_link('foo-1.1.tar.gz', '1.1')],
+            'bar': [self.mock_link('bar-0.1.tar.gz', '0.1')],
+            'baz': [self.mock_link('baz-2.0.zip', '2.0')],
+        }
+
+    def test_serial(self):
+        source, destination = self.mock_repos(self.links())
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar', 'baz']))
+        synced, failed = sync.sync()
+        self.assertEqual(synced, ['bar-0.1.tar.gz', 'baz-2.0.zip', 'foo-1.0.tar.gz', 'foo-1.1.tar.gz'])
+        self.assertEqual(failed, [])
+        self.assertEqual(destination.upload.call_count, 4)
+
+    def test_workers_match_serial(self):
+        source, destination = self.mock_repos(self.links())
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar', 'baz']), workers=3)
+        synced, failed = sync.sync()
+        self.assertEqual(sorted(synced), ['bar-0.1.tar.gz', 'baz-2.0.zip', 'foo-1.0.tar.gz', 'foo-1.1.tar.gz'])
+        self.assertEqual(failed, [])
+        self.assertEqual(destination.upload.call_count, 4)
+
+    def test_up_to_date(self):
+        links = self.links()
+        source, destination = self.mock_repos(links, links)
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar']), workers=2)
+        self.assertEqual(sync.sync(), ([], []))
+        self.assertFalse(destination.upload.called)
+
+    def test_invalid_distribution(self):
+        links = self.links()
+        links['bar'][0].download.side_effect = InvalidDistribution('bar-0.1.tar.gz')
+        source, destination = self.mock_repos(links)
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['bar']), workers=2)
+        self.assertEqual(sync.sync(), ([], ['bar-0.1.tar.gz']))
+
+    def test_failed_downloads(self):
+        links = self.links()
+        links['foo'][0].download.side_effect = DigestMismatchException('/tmp/foo-1.0.tar.gz', 'sha256', 'a' * 64)
+        links['bar'][0].download.side_effect = DownloadFailed('bar-0.1.tar.gz', 503)
+        source, destination = self.mock_repos(links)
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar']), workers=2)
+        synced, failed = sync.sync()
+        self.assertEqual(synced, ['foo-1.1.tar.gz'])
+        self.assertEqual(sorted(failed), ['bar-0.1.tar.gz', 'foo-1.0.tar.gz'])
+
+    def test_rejected_upload(self):
+        journal = mock.Mock()
+        journal.is_package_done.return_value = False
+        journal.has_uploaded.return_value = False
+        source, destination = self.mock_repos(self.links())
+        destination.upload.side_effect = lambda d: (400, 'Bad Request') if d.path.endswith('foo-1.0.tar.gz') else (200, '')
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar']), journal=journal)
+        synced, failed = sync.sync()
+        self.assertEqual(synced, ['bar-0.1.tar.gz', 'foo-1.1.tar.gz'])
+        self.assertEqual(failed, ['foo-1.0.tar.gz'])
+        self.assertEqual(sorted(c[0][0] for c in journal.uploaded.call_args_list), ['bar-0.1.tar.gz', 'foo-1.1.tar.gz'])
+        self.assertEqual([c[0][0] for c in journal.package_done.call_args_list], ['bar'])
+
+    def test_worker_errors_propagate(self):
+        links = self.links()
+        links['baz'][0].download.side_effect = IOError('connection reset')
+        source, destination = self.mock_repos(links)
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar', 'baz']), workers=3)
+        with self.assertRaises(IOError):
+            sync.sync()
+
+    def test_output_grouped_by_package(self):
+        source, destination = self.mock_repos(self.links())
+        ui = BufferedReporter()
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar', 'baz']), ui=ui, workers=3)
+        sync.sync()
+
+        packages = [
+            args[0].split()[-1].rstrip('.') for name, args, kwargs in ui.calls
+            if name == 'report' and args[0].startswith('Checking')
+        ]
+        self.assertEqual(sorted(packages), ['bar', 'baz', 'foo'])
+
+        # every version following a package header belongs to that package
+        versions = {'foo': ['1.0', '1.1'], 'bar': ['0.1'], 'baz': ['2.0']}
+        current = None
+        for name, args, kwargs in ui.calls:
+            message = args[0]
+            if message.startswith('Checking'):
+                current = message.split()[-1].rstrip('.')
+            elif message.startswith('version'):
+                self.assertTrue(message.split()[1].rstrip(':') in versions[current])
+        self.assertTrue(ui.calls[-1][1][0].startswith('Synchronised 4'))
+
+    def test_journal_skips_completed(self):
+        journal = mock.Mock()
+        journal.is_package_done.side_effect = lambda spec: spec == 'bar'
+        journal.has_uploaded.side_effect = lambda basename, destination=None: basename == 'foo-1.0.tar.gz'
+        source, destination = self.mock_repos(self.links())
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar', 'baz']), journal=journal)
+        synced, failed = sync.sync()
+        self.assertEqual(synced, ['baz-2.0.zip', 'foo-1.1.tar.gz'])
+        self.assertEqual(sorted(c[0][0] for c in source.all_distributions.call_args_list), ['baz', 'foo'])
+        self.assertEqual(sorted(c[0][0] for c in journal.uploaded.call_args_list), ['baz-2.0.zip', 'foo-1.1.tar.gz'])
+        self.assertEqual(sorted(c[0][0] for c in journal.package_done.call_args_list), ['baz', 'foo'])
+
+    def test_journal_without_destinations(self):
+        journal = mock.Mock()
+        journal.is_package_done.return_value = False
+        journal.has_uploaded.side_effect = lambda basename, destination=None: destination is None
+        source, destination = self.mock_repos(self.links())
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo']), journal=journal)
+        self.assertEqual(sync.sync(), ([], []))
+
+        second = self.mock_destination(uri='https://second.example.com')
+        sync = Sync(source, [destination, second], exclude=Versions(), include=Versions(['foo']), journal=journal)
+        synced, failed = sync.sync()
+        self.assertEqual(synced, ['foo-1.0.tar.gz', 'foo-1.1.tar.gz'])
+
+    def test_journal_package_not_done_if_failed(self):
+        journal = mock.Mock()
+        journal.is_package_done.return_value = False
+        journal.has_uploaded.return_value = False
+        links = self.links()
+        links['foo'][1].download.side_effect = InvalidDistribution('foo-1.1.tar.gz')
+        source, destination = self.mock_repos(links)
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar']), journal=journal)
+        synced, failed = sync.sync()
+        self.assertEqual(failed, ['foo-1.1.tar.gz'])
+        self.assertEqual([c[0][0] for c in journal.package_done.call_args_list], ['bar'])
+
+    def test_plan_and_execute(self):
+        links = self.links()
+        for basename, link in [(l.basename, l) for ls in links.values() for l in ls]:
+            link.package_name = basename.split('-')[0]
+            link.url = 'https://example.com/packages/%s' % basename
+            link.content_length.return_value = 10
+            link.hashes = {'sha256': basename}
+        source, destination = self.mock_repos(links, {'foo': links['foo'][:1]})
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo', 'bar', 'baz']), workers=2)
+
+        plan = sync.plan()
+        self.assertEqual([e['basename'] for e in plan], ['bar-0.1.tar.gz', 'baz-2.0.zip', 'foo-1.1.tar.gz'])
+        self.assertEqual(plan.size, 30)
+        self.assertFalse(destination.upload.called)
+        for ls in links.values():
+            for link in ls:
+                self.assertFalse(link.download.called)
+
+        source.all_distributions.reset_mock()
+        by_url = dict((l.url, l) for ls in links.values() for l in ls)
+        with mock.patch('pkgsync.sync.RemoteDistribution') as remote:
+            remote.side_effect = lambda repository, url, package_name, **kwargs: by_url[url]
+            synced, failed = sync.execute(plan)
+        self.assertEqual(sorted(synced), ['bar-0.1.tar.gz', 'baz-2.0.zip', 'foo-1.1.tar.gz'])
+        self.assertFalse(source.all_distributions.called)
+        self.assertEqual(destination.upload.call_count, 3)
+        for args, kwargs in remote.call_args_list:
+            self.assertEqual(kwargs['hashes'], {'sha256': by_url[args[1]].basename})
+            self.assertEqual(kwargs['size'], 10)
+
+    def test_specs_grouped_by_package(self):
+        links = self.links()
+        source, destination = self.mock_repos(links)
+        include = Versions(['foo==1.0', 'foo>=1.0', 'bar', 'Bar<1.0'])
+        sync = Sync(source, destination, exclude=Versions(), include=include)
+        synced, failed = sync.sync()
+        self.assertEqual(synced, ['bar-0.1.tar.gz', 'foo-1.0.tar.gz', 'foo-1.1.tar.gz'])
+        self.assertEqual(source.all_distributions.call_count, 2)
+        self.assertEqual(destination.all_distributions.call_count, 2)
+
+    def test_no_source_distributions(self):
+        source, destination = self.mock_repos({})
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo']))
+        self.assertEqual(sync.sync(), ([], []))
+        self.assertFalse(destination.all_distributions.called)
+
+    def test_index_concurrency(self):
+        source, destination = self.mock_repos(self.links(), {'foo': self.links()['foo'][:1]})
+        sync = Sync(
+            source, destination, exclude=Versions(), include=Versions(['foo', 'bar', 'baz']),
+            workers=2, index_concurrency=3,
+        )
+        synced, failed = sync.sync()
+        self.assertEqual(sorted(synced), ['bar-0.1.tar.gz', 'baz-2.0.zip', 'foo-1.1.tar.gz'])
+        self.assertEqual(source.all_distributions.call_count, 3)
+        self.assertEqual(destination.all_distributions.call_count, 3)
+
+    def test_multiple_destinations(self):
+        links = self.links()
+        first = self.mock_destination({'foo': links['foo']}, uri='https://first.example.com')
+        second = self.mock_destination({'bar': links['bar']}, uri='https://second.example.com')
+        source, _ = self.mock_repos(links)
+        sync = Sync(source, [first, second], exclude=Versions(), include=Versions(['foo', 'bar', 'baz']))
+        synced, failed = sync.sync()
+        self.assertEqual(sorted(synced), ['bar-0.1.tar.gz', 'baz-2.0.zip', 'foo-1.0.tar.gz', 'foo-1.1.tar.gz'])
+        for ls in links.values():
+            for link in ls:
+                self.assertEqual(link.download.call_count, 1)
+        uploaded = lambda repo: sorted(c[0][0].path.split('/')[-1] for c in repo.upload.call_args_list)
+        self.assertEqual(uploaded(first), ['bar-0.1.tar.gz', 'baz-2.0.zip'])
+        self.assertEqual(uploaded(second), ['baz-2.0.zip', 'foo-1.0.tar.gz', 'foo-1.1.tar.gz'])
+
+    def test_plan_multiple_destinations(self):
+        links = self.links()
+        for basename, link in [(l.basename, l) for ls in links.values() for l in ls]:
+            link.package_name = basename.split('-')[0]
+            link.url = 'https://example.com/packages/%s' % basename
+            link.content_length.return_value = 10
+        first = self.mock_destination({'bar': links['bar']}, uri='https://first.example.com')
+        second = self.mock_destination(uri='https://second.example.com')
+        source, _ = self.mock_repos({'bar': links['bar']})
+        sync = Sync(source, [first, second], exclude=Versions(), include=Versions(['bar']))
+        plan = sync.plan()
+        self.assertEqual([e['destinations'] for e in plan], [['https://second.example.com']])
+
+        with mock.patch('pkgsync.sync.RemoteDistribution') as remote:
+            remote.return_value = links['bar'][0]
+            sync.execute(plan)
+        self.assertFalse(first.upload.called)
+        self.assertEqual(second.upload.call_count, 1)
+
+    def test_registered_release_not_registered_again(self):
+        links = {'foo': [self.mock_link('foo-1.0.zip', '1.0'), self.mock_link('foo-1.1.zip', '1.1')]}
+        source, destination = self.mock_repos(links, {'foo': [self.mock_link('foo-1.0.tar.gz', '1.0')]})
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo']))
+        synced, failed = sync.sync()
+        self.assertEqual(sorted(synced), ['foo-1.0.zip', 'foo-1.1.zip'])
+        self.assertEqual(destination.upload.call_count, 2)
+        self.assertEqual(destination.register.call_count, 1)
+        self.assertEqual(destination.register.call_args[0][0].path, '/nonexistent/foo-1.1.zip')
+
+    def test_register_only(self):
+        links = {'foo': [
+            self.mock_link('foo-1.0.tar.gz', '1.0'),
+            self.mock_link('foo-1.1.tar.gz', '1.1'),
+            self.mock_link('foo-1.1-py2-none-any.whl', '1.1', metadata={}),
+            self.mock_link('foo-1.2.tar.gz', '1.2'),
+        ]}
+        links['foo'][1].fetch_metadata.side_effect = AssertionError('no metadata file')
+        links['foo'][2].fetch_metadata.return_value = 'Metadata-Version: 1.1\nName: foo\nVersion: 1.1\n'
+        links['foo'][3].fetch_metadata.side_effect = MetadataUnavailable('foo-1.2.tar.gz')
+        source, destination = self.mock_repos(links, {'foo': links['foo'][:1]})
+        sync = Sync(source, destination, exclude=Versions(), include=Versions(['foo']), register_only=True)
+        synced, failed = sync.sync()
+
+        self.assertEqual(synced, ['foo-1.1-py2-none-any.whl'])
+        self.assertEqual(failed, ['foo-1.2.tar.gz'])
+        self.assertEqual(destination.register.call_count, 1)
+        self.assertEqual(destination.register.call_args[0][0].meta.register()['name'], 'foo')
+        self.assertFalse(destination.upload.called)
+        for link in links['foo']:
+            self.assertFalse(link.download.called)
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import mock
+from unittest2 import TestCase
+
+from pkgsync.dist import Content
+from pkgsync.upload import Uploader
+
+class PostUploadTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.repository = mock.Mock(
+            uri='https://example.com/upload/',
+            username='user',
+            password='pass',
+        )
+        self.uploader = Uploader(self.repository)
+
+    def content(self, data, chunk_size=4):
+        path = os.path.join(self.dir, 'dist.tar.gz')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return Content(path, chunk_size=chunk_size)
+
+    def post(self, data):
+        with mock.patch('httplib.HTTPSConnection') as connection:
+            self.uploader._post_upload(data)
+        http = connection.return_value
+        headers = dict(call[0] for call in http.putheader.call_args_list)
+        sent = [call[0][0] for call in http.send.call_args_list]
+        return headers, sent
+
+    def test_content_length_is_what_is_sent(self):
+        headers, sent = self.post({
+            ':action': 'file_upload',
+            'name': u'pkgsync',
+            'classifiers': ['A :: B', 'C :: D'],
+            'content': (u'dist.tar.gz', self.content('0123456789')),
+        })
+        self.assertEqual(int(headers['Content-length']), len(''.join(sent)))
+
+    def test_content_is_sent_in_chunks(self):
+        headers, sent = self.post({
+            'content': ('dist.tar.gz', self.content('0123456789')),
+        })
+        self.assertIn('\n\n', sent[0])
+        self.assertEqual(sent[1:4], ['0123', '4567', '89'])
+        self.assertIn('filename="dist.tar.gz"', ''.join(sent))
+
+    def test_extra_newline_after_carriage_return(self):
+        headers, sent = self.post({
+            'content': ('dist.tar.gz', self.content('0123\r')),
+        })
+        self.assertIn('0123\r\n\n--', ''.join(sent))
+        self.assertEqual(int(headers['Content-length']), len(''.join(sent)))
+
+    def test_body_is_unchanged(self):
+        parts = self.uploader._upload_parts({'name': 'pkgsync'}, 'XX')
+        self.assertEqual(
+            ''.join(parts),
+            '\n--XX\nContent-Disposition: form-data; name="name"\n\npkgsync\n--XX--\n'
+        )
+
+    def test_content_endswith(self):
+        content = self.content('0123\r')
+        self.assertTrue(content.endswith('\r'))
+        self.assertFalse(content.endswith('3'))
+        self.assertFalse(self.content('').endswith('\r'))
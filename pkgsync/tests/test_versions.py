@@ -1,3 +1,4 @@
+import mock
 from unittest2 import TestCase
 from StringIO import StringIO
 from textwrap import dedent
@@ -57,3 +58,33 @@ class VersionsTest(TestCase):
         self.assertEquals(len(specs_for), 2)
         self.assertTrue('foo<1.2.3' in specs_for)
         self.assertTrue('foo<1.2.4' in specs_for)
+
+    def test_changed_since(self):
+        repository = mock.Mock()
+        repository.changelog.return_value = [
+            ['pkgsync', '0.1.0', 1362182400, 'new release', 100],
+            ['Django', '1.4.5', 1362182500, 'add source file Django-1.4.5.tar.gz', 101],
+            ['pkgsync', '0.2.0', 1362182600, 'new release', 102],
+        ]
+        versions = Versions.changed_since(repository, 99)
+        repository.changelog.assert_called_with(99)
+        self.assertEqual(versions, set(['pkgsync', 'Django']))
+        self.assertEqual(versions.serial, 102)
+
+    def test_unchanged_since(self):
+        repository = mock.Mock()
+        repository.changelog.return_value = []
+        versions = Versions.changed_since(repository, 102)
+        self.assertEqual(len(versions), 0)
+        self.assertEqual(versions.serial, 102)
+
+    def test_specs_for_ignores_case(self):
+        versions = Versions(['Foo<1.2.3', 'bar<1.2.3'])
+        self.assertEqual(list(versions.specs_for('foo')), ['Foo<1.2.3'])
+
+    def test_by_package(self):
+        versions = Versions(['foo<1.2.3', 'bar', 'Foo>1.0', 'foo==1.2.0'])
+        self.assertEqual(versions.by_package(), [
+            ['bar'],
+            ['Foo>1.0', 'foo<1.2.3', 'foo==1.2.0'],
+        ])
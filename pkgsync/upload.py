@@ -4,7 +4,8 @@ import urlparse
 import base64
 import httplib
 import socket
-import StringIO
+
+from .dist import Content
 
 class Uploader(object):
     """ Sadly because distutils uploads an invalid http post, we must replicate
@@ -86,17 +87,15 @@ class Uploader(object):
 
         return result
 
-    def _post_upload(self, data):
-        # set up the authentication
-        auth = "Basic " + base64.encodestring(
-            self.repository.username + ":" + self.repository.password
-        ).strip()
-
-        # Build up the MIME payload for the POST data
-        boundary = '--------------GHSKFJDLGDS7543FJKLFHRE75642756743254'
+    def _upload_parts(self, data, boundary):
+        """
+        :return: A list of the strings, and the `Content` of the distribution,
+            which in turn make up the MIME payload for an upload request, so
+            that the payload can be sent without being held in memory.
+        """
         sep_boundary = '\n--' + boundary
         end_boundary = sep_boundary + '--'
-        body = StringIO.StringIO()
+        parts = []
         for key, value in data.items():
             # handle multiple entries for the same name
             if type(value) != type([]):
@@ -107,17 +106,31 @@ class Uploader(object):
                     value = value[1]
                 else:
                     fn = ""
-                value = str(value)
-                body.write(sep_boundary)
-                body.write('\nContent-Disposition: form-data; name="%s"'%key)
-                body.write(fn)
-                body.write("\n\n")
-                body.write(value)
-                if value and value[-1] == '\r':
-                    body.write('\n')  # write an extra newline (lurve Macs)
-        body.write(end_boundary)
-        body.write("\n")
-        body = body.getvalue()
+                if not isinstance(value, Content):
+                    value = str(value)
+                parts.append(
+                    sep_boundary +
+                    '\nContent-Disposition: form-data; name="%s"'%key +
+                    fn +
+                    "\n\n"
+                )
+                parts.append(value)
+                if value and value.endswith('\r'):
+                    parts.append('\n')  # write an extra newline (lurve Macs)
+        parts.append(end_boundary + "\n")
+        return parts
+
+    def _post_upload(self, data):
+        # set up the authentication
+        auth = "Basic " + base64.encodestring(
+            self.repository.username + ":" + self.repository.password
+        ).strip()
+
+        # Build up the MIME payload for the POST data, the length of which is
+        # known without reading the distribution
+        boundary = '--------------GHSKFJDLGDS7543FJKLFHRE75642756743254'
+        parts = self._upload_parts(data, boundary)
+        content_length = sum(len(part) for part in parts)
 
         # build the Request
         # We can't use urllib2 since we need to send the Basic
@@ -138,10 +151,15 @@ class Uploader(object):
             http.putrequest("POST", url)
             http.putheader('Content-type',
                            'multipart/form-data; boundary=%s'%boundary)
-            http.putheader('Content-length', str(len(body)))
+            http.putheader('Content-length', str(content_length))
             http.putheader('Authorization', auth)
             http.endheaders()
-            http.send(body)
+            for part in parts:
+                if isinstance(part, Content):
+                    for chunk in part: # straight from disk
+                        http.send(chunk)
+                else:
+                    http.send(part)
         except socket.error, e:
             return
 
@@ -70,9 +70,38 @@ class Versions(set):
         versions = repository.packages()
         return cls(versions)
 
+    @classmethod
+    def changed_since(cls, repository, serial):
+        """
+        :param repository: A `Repository` with a PyPI-style changelog.
+        :param serial: The serial of the last change already synchronised.
+        :returns: An instantiated `Versions` object naming every package that
+            has changed since the given serial, with the serial of the most
+            recent of those changes as its ``serial`` attribute.
+        """
+        changes = repository.changelog(serial)
+        versions = cls(set(change[0] for change in changes))
+        versions.serial = max([change[4] for change in changes] or [serial])
+        return versions
+
     def specs_for(self, package_name):
-        """Yield the specs which refer to the given package name"""
+        """Yield the specs which refer to the given package name, ignoring case"""
+        key = package_name.lower()
         for spec in self:
             spec_as_req = pkg_resources.Requirement.parse(spec)
-            if spec_as_req.project_name == package_name:
+            if spec_as_req.key == key:
                 yield spec
+
+    def by_package(self):
+        """
+        :returns: A list with a list of specs for each package named in this
+            set, so that every spec for a package can be evaluated against a
+            single listing of its distributions. Packages whose names differ
+            only in case are grouped together. Both the packages and the
+            specs for each are sorted.
+        """
+        grouped = {}
+        for spec in self:
+            key = pkg_resources.Requirement.parse(spec).key
+            grouped.setdefault(key, []).append(spec)
+        return [sorted(grouped[key]) for key in sorted(grouped)]